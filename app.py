@@ -2,17 +2,11 @@ from flask import Flask, render_template, request, jsonify, redirect, url_for, s
 from markupsafe import Markup
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
-from sheets_helper import get_sheet_data
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 import threading
 import time
 import io
-from docx.shared import Inches
-from docx.oxml import OxmlElement
-from docx.oxml.ns import qn
 from dotenv import load_dotenv
 import os
 from werkzeug.utils import secure_filename
@@ -29,6 +23,20 @@ from logging.handlers import RotatingFileHandler
 import uuid
 from flask_limiter import Limiter
 from validation import validate_project_data, validate_item_data, validate_file_upload, ValidationError, validate_string
+from proposal_template import get_template
+from proposal_cache import ProposalCache, proposal_cache_key
+from proposal_jobs import JobStore, RenderQueue, QueueFullError, render_seconds
+from metrics import registry as metrics_registry, PhaseTimer
+from proposal_export import stream_proposal_zip
+from price_cache import PriceCache, PriceStore
+from price_sources import get_price_source
+from repricing import reprice_items, saved_item_names
+from change_feed import ChangeFeed, FeedFullError, format_event
+from catalog import Catalog, CatalogConflictError
+from uploads import UploadRequest, UploadFile, as_upload, upload_directory
+from item_images import store_item_image, delete_item_image, image_variants, image_filename, is_hashed, IMMUTABLE_MAX_AGE
+from pricing import PricingRules, load_tier_table, percent_to_basis_points, price_items, format_cents
+import click
 
 # Load environment variables from .env file
 load_dotenv()
@@ -39,12 +47,17 @@ load_dotenv()
 # google_client_id = os.getenv('GOOGLE_CLIENT_ID')
 
 app = Flask(__name__)
+# Uploaded files are streamed to disk, hashed and measured while the request is parsed
+app.request_class = UploadRequest
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///items.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'default-dev-key-please-change')
 app.config['UPLOAD_FOLDER'] = 'static/item_images'
+# Where uploads are written while they are received (default: instance/uploads)
+app.config['UPLOAD_TEMP_FOLDER'] = os.getenv('UPLOAD_TEMP_FOLDER') or None
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+TEMPLATE_PATH = os.path.join('static/generated_docs', 'template.docx')
 
 # CSP configuration
 app.config['CSP_REPORT_ONLY'] = os.getenv('CSP_REPORT_ONLY', 'False').lower() == 'true'
@@ -194,7 +207,7 @@ def inject_csrf_token():
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize SQLAlchemy
-from models import db, User, Project, Item
+from models import db, User, Project, Item, CatalogItem
 db.init_app(app)
 migrate = Migrate(app, db)
 
@@ -211,119 +224,145 @@ from auth import limiter
 # Create a lock for thread-safe operations
 cleanup_lock = threading.Lock()
 
-# Function to clean up old temporary files
-def cleanup_old_files():
-    """Clean up temporary document files older than 15 minutes"""
-    try:
-        with cleanup_lock:
-            docs_dir = 'static/generated_docs'
-            if not os.path.exists(docs_dir):
-                return
-                
-            current_time = time.time()
-            fifteen_minutes_ago = current_time - 900  # 15 minutes in seconds
-            
-            # Get all files in the directory
-            for filename in os.listdir(docs_dir):
-                # Skip template files
-                if filename in ['template.docx', 'reference.docx']:
-                    continue
-                    
-                # Check if it's an output file
-                if filename.startswith('output_'):
-                    file_path = os.path.join(docs_dir, filename)
-                    
-                    # Check if it's a file and not a directory
-                    if os.path.isfile(file_path):
-                        # Get the file's modification time
-                        file_mod_time = os.path.getmtime(file_path)
-                        
-                        # If the file is older than 15 minutes, delete it
-                        if file_mod_time < fifteen_minutes_ago:
-                            try:
-                                os.remove(file_path)
-                                print(f"Cleaned up old temporary file: {file_path}")
-                            except Exception as e:
-                                print(f"Error removing old file {file_path}: {str(e)}")
-                                # Try again with a delay
-                                try:
-                                    time.sleep(0.5)
-                                    if os.path.exists(file_path):
-                                        os.remove(file_path)
-                                        print(f"Cleaned up old temporary file on second attempt: {file_path}")
-                                except Exception as e2:
-                                    print(f"Failed to remove file on second attempt: {str(e2)}")
-    except Exception as e:
-        print(f"Error in cleanup_old_files: {str(e)}")
-
-# Schedule periodic cleanup
-def start_cleanup_scheduler():
-    """Start a background thread to periodically clean up old files"""
-    def run_cleanup():
-        while True:
-            cleanup_old_files()
-            # Sleep for 15 minutes before next cleanup
-            time.sleep(900)
-    
-    # Start the cleanup thread
-    cleanup_thread = threading.Thread(target=run_cleanup, daemon=True)
-    cleanup_thread.start()
-
-# Start the cleanup scheduler when the app starts
-start_cleanup_scheduler()
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# List of available items with their images
-class ItemDefinition:
-    def __init__(self, name, image_path=None):
-        self.name = name
-        self.image_path = image_path
+# Items offered on project pages, loaded from the catalog_item table once it exists;
+# edits made by other worker processes are picked up every CATALOG_SYNC_SECONDS
+catalog = Catalog(sync_interval=float(os.getenv('CATALOG_SYNC_SECONDS', '1')))
 
-ITEMS = []
+# The catalog's original pipe-delimited file, imported into a new catalog table
+ITEMS_FILE = 'items.txt'
 
-def save_items_to_file():
-    """Save the ITEMS list to a file"""
-    with open('items.txt', 'w') as f:
-        for item in ITEMS:
-            f.write(f"{item.name}|{item.image_path or ''}\n")
+def publish_catalog_change(snapshot, changed, removed):
+    """Tell open pages which catalog entries were added or edited and which were removed"""
+    change_feed.publish('catalog', {
+        'version': snapshot.version,
+        'changed': [item.as_dict() for item in changed],
+        'removed': removed,
+    })
 
-def load_items_from_file():
-    """Load items from file if it exists"""
-    global ITEMS
-    try:
-        with open('items.txt', 'r') as f:
-            ITEMS = []
-            for line in f:
-                if line.strip():
-                    parts = line.strip().split('|')
-                    name = parts[0]
-                    image_path = parts[1] if len(parts) > 1 and parts[1] else None
-                    ITEMS.append(ItemDefinition(name, image_path))
-    except FileNotFoundError:
-        # If file doesn't exist, save current items
-        ITEMS = [ItemDefinition(name) for name in ['Curbs', 'Pipes']]
-        save_items_to_file()
-
-# Load items when app starts
-load_items_from_file()
-
-# Cache for prices
-price_cache = {}
-last_update = 0
-CACHE_DURATION = 300  # 5 minutes in seconds
-
-def update_price_cache():
-    global price_cache, last_update
-    current_time = time.time()
-    
-    # Update cache if it's expired
-    if current_time - last_update > CACHE_DURATION:
-        new_prices = get_sheet_data()
-        if new_prices:  # Only update if we got data
-            price_cache = new_prices
-            last_update = current_time
+catalog.subscribe(publish_catalog_change)
+
+def release_item_image(image_path):
+    """Delete an item image and its variants once no catalog entry uses them"""
+    if image_path:
+        delete_item_image(image_path, app.config['UPLOAD_FOLDER'],
+                          [entry.image_path for entry in catalog.snapshot.sorted])
+
+@app.template_filter('thumbnail')
+def thumbnail_filter(image_path):
+    return image_variants(image_path)['thumbnail_path']
+
+@app.after_request
+def cache_item_images(response):
+    """Let browsers keep content-hashed item images; a changed image gets a new name"""
+    if request.endpoint == 'static' and response.status_code in (200, 304):
+        filename = (request.view_args or {}).get('filename', '')
+        if filename.startswith('item_images/') and is_hashed(image_filename(filename)):
+            response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+# Parse the proposal template once at startup
+try:
+    get_template(TEMPLATE_PATH)
+except Exception as e:
+    print(f"Error loading proposal template: {str(e)}")
+
+# Cache of rendered proposals, keyed by project content and template hash
+proposal_cache = ProposalCache(
+    os.getenv('PROPOSAL_CACHE_DIR', os.path.join(app.instance_path, 'proposal_cache')),
+    max_memory_bytes=int(os.getenv('PROPOSAL_CACHE_MEMORY_MB', '64')) * 1024 * 1024,
+    max_disk_entries=int(os.getenv('PROPOSAL_CACHE_DISK_ENTRIES', '500'))
+)
+
+# Per-phase render timings; phases include the template region, e.g. fill.document.tables
+proposal_phase_seconds = metrics_registry.histogram(
+    'proposal_phase_seconds', 'Time spent in each proposal generation phase', ['template', 'phase'],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+)
+
+# Background proposal rendering, sized separately from the HTTP workers
+app.config['PROPOSAL_ASYNC'] = os.getenv('PROPOSAL_ASYNC', 'False').lower() == 'true'
+render_queue = RenderQueue(
+    # Job states are shared through a file, so any worker on the host can answer polls and downloads
+    JobStore(os.getenv('PROPOSAL_JOB_STORE_PATH') or os.path.join(app.instance_path, 'proposal_jobs.db')),
+    max_workers=int(os.getenv('PROPOSAL_RENDER_WORKERS', '2')),
+    max_queued=int(os.getenv('PROPOSAL_RENDER_QUEUE_SIZE', '50'))
+)
+
+# Where prices come from: the Google Sheet, or a local CSV file or SQLite database
+price_source = get_price_source(
+    os.getenv('PRICE_SOURCE') or 'sheets',
+    os.getenv('PRICE_SOURCE_PATH'),
+    os.getenv('PRICE_SOURCE_TABLE')
+)
+
+# Whether a price refresh updates saved items: off, unsent (projects whose proposal
+# hasn't been sent) or all
+app.config['PRICE_REPRICE'] = os.getenv('PRICE_REPRICE') or 'off'
+
+def reprice_changed_items(diff):
+    """Carry changed and newly added spreadsheet prices over to saved items; runs in the refresh thread"""
+    mode = app.config['PRICE_REPRICE']
+    # Added names matter too: items saved before their name was on the sheet were saved at 0
+    prices = {**diff.changed, **diff.added}
+    if mode == 'off' or not prices:
+        return
+    with app.app_context():
+        result = reprice_items(prices, unsent_only=mode == 'unsent', rules=pricing_rules())
+        db.session.commit()
+    for project_id in result.project_ids:
+        proposal_cache.invalidate(project_id)
+    print(f"Re-priced {result.summary()}")
+
+# Prices are served from the current snapshot and refreshed in the background;
+# the snapshot file is shared by every worker process on the host
+price_cache = PriceCache(
+    price_source.load,
+    max_age=int(os.getenv('PRICE_CACHE_SECONDS', '300')),
+    retry_interval=int(os.getenv('PRICE_RETRY_SECONDS', '30')),
+    store=PriceStore(os.getenv('PRICE_SNAPSHOT_PATH') or os.path.join(app.instance_path, 'price_snapshot.db')),
+    on_change=reprice_changed_items
+)
+
+# Markup and tax in basis points; quantity breaks are re-read when their file changes
+PRICE_MARKUP_BP = percent_to_basis_points(os.getenv('PRICE_MARKUP_PERCENT'))
+PRICE_TAX_BP = percent_to_basis_points(os.getenv('PRICE_TAX_PERCENT'))
+
+def pricing_rules():
+    return PricingRules(PRICE_MARKUP_BP, PRICE_TAX_BP, load_tier_table(os.getenv('PRICE_TIERS_PATH')))
+
+def priced_items(items):
+    """Items with their unit and line prices from the pricing engine, and the project totals"""
+    items = list(items)
+    result = price_items(items, pricing_rules())
+    lines = [{'name': item.name, 'quantity': item.quantity, 'price': item.price,
+              'unit_price': int(unit) / 100, 'line_total': int(line) / 100}
+             for item, unit, line in zip(items, result.unit_cents, result.line_cents)]
+    totals = {'subtotal': int(result.subtotal_cents[0]) / 100, 'tax': int(result.tax_cents[0]) / 100,
+              'total': int(result.total_cents[0]) / 100}
+    return lines, totals, result
+
+# Price and catalog changes pushed to open project pages. Every open page holds a
+# /changes stream, and with it a worker thread, for up to CHANGE_FEED_MAX_AGE, so
+# the feed is off unless the app runs on cooperative workers (see gunicorn.conf.py)
+app.config['CHANGE_FEED'] = os.getenv('CHANGE_FEED', 'False').lower() == 'true'
+change_feed = ChangeFeed(max_streams=int(os.getenv('CHANGE_FEED_MAX_STREAMS', '100')),
+                         max_user_streams=int(os.getenv('CHANGE_FEED_MAX_USER_STREAMS', '10')))
+# Larger price changes are announced without entries; pages reload the table from /get_prices
+MAX_PUSHED_PRICES = 500
+
+def publish_price_change(snapshot, diff):
+    if not diff:
+        return
+    changed = {**diff.changed, **diff.added}
+    if len(changed) + len(diff.removed) > MAX_PUSHED_PRICES:
+        change_feed.publish('prices', {'version': snapshot.version, 'reload': True})
+    else:
+        change_feed.publish('prices', {'version': snapshot.version, 'changed': changed, 'removed': diff.removed})
+
+price_cache.subscribe(publish_price_change)
 
 def format_date(date_str):
     """Format a date string to MM-DD-YYYY format"""
@@ -386,16 +425,13 @@ def project(project_id):
         flash('You do not have permission to view this project.', 'error')
         return redirect(url_for('index'))
     
-    update_price_cache()  # Update prices when viewing a project
-    
     # Format the date to MM-DD-YYYY
     if project.date:
         project.date = format_date(project.date)
     
     translation = translate_to_words(project.items)
+    lines, totals, _ = priced_items(project.items)
     
-    # Pass the items list with their names and image paths
-    items_with_images = [{'name': item.name, 'image_path': item.image_path} for item in ITEMS]
     
     # Get flash messages
     flash_messages = []
@@ -405,19 +441,121 @@ def project(project_id):
         for category, message in messages:
             flash_messages.append({'category': category, 'message': message})
     
+    catalog_snapshot = catalog.snapshot
     return render_template('project.html', 
                          project=project, 
-                         items=items_with_images, 
+                         lines=lines,
+                         totals=totals,
+                         items=catalog_snapshot.sorted, 
+                         catalog_version=catalog_snapshot.version,
                          translation=translation,
-                         price_cache=price_cache,
+                         async_proposals=app.config['PROPOSAL_ASYNC'],
+                         change_feed_enabled=app.config['CHANGE_FEED'],
                          flash_messages=flash_messages)
 
 @app.route('/get_price/<item_name>')
 def get_price(item_name):
-    update_price_cache()
-    price = price_cache.get(item_name, None)
+    price = price_cache.get(item_name)
     return jsonify({'price': price})
 
+# Seconds between keep-alive comments on a change stream, and before the stream
+# is closed so the browser reconnects (resuming from its Last-Event-ID)
+CHANGE_FEED_KEEPALIVE = 15
+CHANGE_FEED_MAX_AGE = 600
+
+# Streams reconnect every CHANGE_FEED_MAX_AGE and after every dropped connection, so
+# they are bounded by the per-user stream cap rather than the request rate limits
+@app.route('/changes')
+@login_required
+@limiter.exempt
+def changes():
+    """
+    Stream price and catalog changes as server-sent events.
+
+    The stream opens with a hello event carrying the current price and
+    catalog versions, or a reset event carrying them when the browser's
+    Last-Event-ID came from another worker; after that each event carries
+    only a version and the entries that changed.
+    """
+    if not app.config['CHANGE_FEED']:
+        return jsonify({'success': False, 'error': 'The change feed is not enabled'}), 404
+    
+    try:
+        change_feed.open_stream(current_user.id)
+    except FeedFullError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    
+    # Keep prices and the catalog current for the open streams even when no page is being loaded
+    price_cache.watch()
+    catalog.watch(app)
+    last_event_id = request.headers.get('Last-Event-ID')
+    user_id = current_user.id
+    
+    def stream():
+        try:
+            resumed = change_feed.resume_after(last_event_id) if last_event_id else None
+            after = change_feed.last_id if resumed is None else resumed
+            # Events from another worker can't be replayed here, so that page reloads everything
+            opening = 'reset' if last_event_id and resumed is None else 'hello'
+            versions = json.dumps({'prices': price_cache.snapshot.version, 'catalog': catalog.snapshot.version})
+            yield f'retry: 5000\n{format_event(change_feed.event_id(after), opening, versions)}'
+            deadline = time.monotonic() + CHANGE_FEED_MAX_AGE
+            while time.monotonic() < deadline:
+                events = change_feed.wait(after, CHANGE_FEED_KEEPALIVE)
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+                for event_id, event, data in events:
+                    after = event_id
+                    yield format_event(change_feed.event_id(event_id), event, data)
+        finally:
+            change_feed.close_stream(user_id)
+    
+    response = app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a proxy buffer the stream
+    return response
+
+# Most item names one /get_prices request may ask for
+MAX_PRICE_LOOKUP = 1000
+
+# Project pages load the whole table and batch their lookups here, so logged-in
+# users aren't held to the default request limits
+@app.route('/get_prices', methods=['GET', 'POST'])
+@login_required
+@limiter.exempt
+def get_prices():
+    """
+    Look up many prices in one request.
+
+    Names come from repeated ?item= arguments or a JSON body of
+    {"items": [...]}. Without names the whole table is returned from the
+    snapshot's precomputed JSON, with an ETag so unchanged tables are a 304.
+    """
+    snapshot = price_cache.snapshot
+    if request.method == 'POST':
+        names = (request.get_json(silent=True) or {}).get('items')
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            return jsonify({'success': False, 'error': 'items must be a list of item names'}), 400
+    else:
+        names = request.args.getlist('item')
+    
+    if names:
+        if len(names) > MAX_PRICE_LOOKUP:
+            return jsonify({'success': False, 'error': f'At most {MAX_PRICE_LOOKUP} items can be looked up at once'}), 400
+        return jsonify({'version': snapshot.version, 'prices': {name: snapshot.prices.get(name) for name in names}})
+    
+    if request.if_none_match.contains(snapshot.etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(snapshot.table_json, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/create_project', methods=['POST'])
 @login_required
 def create_project():
@@ -518,6 +656,7 @@ def update_project(project_id):
         project.address = validated_data['address']
         
         db.session.commit()
+        proposal_cache.invalidate(project.id)
         
         flash('Project updated successfully!', 'success')
         return redirect(url_for('project', project_id=project.id, success=True))
@@ -553,12 +692,15 @@ def add_item(project_id):
         
         db.session.add(item)
         db.session.commit()
+        proposal_cache.invalidate(project.id)
         
         translation = translate_to_words(project.items)
+        lines, totals, _ = priced_items(project.items)
         
         return jsonify({
             'success': True,
-            'items': [{'name': i.name, 'quantity': i.quantity, 'price': i.price} for i in project.items],
+            'items': lines,
+            'totals': totals,
             'translation': translation
         })
     except ValidationError as e:
@@ -579,13 +721,34 @@ def clear_items(project_id):
     for item in project.items:
         db.session.delete(item)
     db.session.commit()
+    proposal_cache.invalidate(project.id)
     
     return jsonify({
         'success': True,
         'items': [],
+        'totals': {'subtotal': 0, 'tax': 0, 'total': 0},
         'translation': ''
     })
 
+@app.route('/proposal_sent/<int:project_id>', methods=['POST'])
+@login_required
+def mark_proposal_sent(project_id):
+    """Record that a project's proposal was sent, or clear it with {"sent": false}"""
+    project = Project.query.get_or_404(project_id)
+    
+    # Check if the project belongs to the current user
+    if project.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'success': False, 'error': 'Permission denied'})
+    
+    data = request.get_json(silent=True) or {}
+    project.proposal_sent_at = datetime.utcnow() if data.get('sent', True) else None
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'proposal_sent_at': project.proposal_sent_at.isoformat() if project.proposal_sent_at else None
+    })
+
 @app.route('/delete_project/<int:project_id>', methods=['POST'])
 @login_required
 def delete_project(project_id):
@@ -598,367 +761,386 @@ def delete_project(project_id):
     
     db.session.delete(project)
     db.session.commit()
+    proposal_cache.invalidate(project_id)
     
     flash('Project deleted successfully!', 'success')
     return redirect(url_for('index'))
 
-@app.route('/generate_word/<int:project_id>', methods=['POST'])
+def proposal_values(project):
+    """Build the placeholder values for a project's proposal"""
+    # Unit prices, line totals and the project total, in cents, from the pricing engine
+    items = list(project.items)
+    pricing = price_items(items, pricing_rules())
+    
+    # Process address for new placeholders
+    street_address = ""
+    city_address = ""
+    if project.address:
+        # Split address by commas
+        parts = [p.strip() for p in project.address.split(',')]
+        if len(parts) >= 3:  # Make sure we have enough parts
+            street_address = parts[0]  # Everything before first comma
+            # Take everything between first and last comma (city, state, zip)
+            city_address = ', '.join(parts[1:-1])
+    
+    # Rows for {{LineItems}} (one per item) and {{LineItemsByName}} (one per item name) tables
+    line_items = []
+    by_name = {}
+    for item, unit, extended in zip(items, pricing.unit_cents.tolist(), pricing.line_cents.tolist()):
+        line_items.append({
+            'ItemName': item.name,
+            'ItemQuantity': str(item.quantity),
+            'ItemUnitPrice': format_cents(unit),
+            'ItemTotal': format_cents(extended),
+        })
+        quantity, total = by_name.get(item.name, (0, 0))
+        by_name[item.name] = (quantity + item.quantity, total + extended)
+    total_price = int(pricing.total_cents[0])
+    
+    # Placeholder values by name; {{Name}} and {{ Name }} both match
+    return {
+        'Name': project.name or '',
+        'Date': format_date(project.date) if project.date else '',
+        'Attn': project.attn or '',
+        'ContractorName': project.contractor_name or '',
+        'ContractorEmail': project.contractor_email or '',
+        'JobContact': project.job_contact or '',
+        'JobContactPhone': project.job_contact_phone or '',
+        'StreetAdd': street_address,
+        'CityAdd': city_address,
+        'Subtotal': format_cents(pricing.subtotal_cents[0]) if total_price else '',
+        'Tax': format_cents(pricing.tax_cents[0]) if pricing.tax_cents[0] else '',
+        'TotalPrice': format_cents(total_price) if total_price else '',
+        'LineItems': line_items,
+        'LineItemsByName': [{
+            'ItemName': name,
+            'ItemQuantity': str(quantity),
+            'ItemUnitPrice': format_cents((total + quantity // 2) // quantity) if quantity else '',
+            'ItemTotal': format_cents(total),
+        } for name, (quantity, total) in by_name.items()],
+    }
+
+def observe_proposal_phases(timer, template):
+    """One observation per phase per request, labelled by template for a per-template breakdown"""
+    timer.observe(proposal_phase_seconds, template=os.path.basename(template.path))
+
+def render_proposal(project_id, placeholders, cache_key, template, timer=None, mode='sync'):
+    """
+    Render a proposal into the cache unless it is already there, and return the cache entry.
+
+    The phases are observed here unless the caller passes its own timer and
+    observes it once the response is sent.
+    """
+    observe = timer is None
+    timer = timer or PhaseTimer()
+    with timer.phase('cache'):
+        cached = proposal_cache.get(cache_key)
+    if cached is None:
+        # Rewrite the placeholder parts of the pre-parsed template; only indexed runs are touched
+        start_time = time.perf_counter()
+        cached = template.render(placeholders, timer)
+        # Cache hits are left out so the histogram shows what rendering costs
+        render_seconds.observe(time.perf_counter() - start_time, mode=mode)
+        with timer.phase('cache'):
+            proposal_cache.put(project_id, cache_key, cached)
+    
+    if observe:
+        observe_proposal_phases(timer, template)
+    return cached
+
+def send_proposal(cached, cache_key, download_name):
+    """Send a cached proposal, either from memory or from its on-disk file"""
+    # On-disk entries are sent by path so the server can use sendfile
+    output = cached if isinstance(cached, str) else io.BytesIO(cached)
+    response = send_file(
+        output,
+        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        as_attachment=True,
+        download_name=download_name,
+        etag=cache_key,
+        conditional=False
+    )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/generate_word/<int:project_id>', methods=['GET', 'POST'])
 def generate_word(project_id):
     try:
-        project = Project.query.get_or_404(project_id)
+        timer = PhaseTimer()
+        with timer.phase('query'):
+            project = Project.query.get_or_404(project_id)
+            placeholders = proposal_values(project)
+            items = project.items
         
-        # Create output directory if it doesn't exist
-        os.makedirs('static/generated_docs', exist_ok=True)
+        with timer.phase('template'):
+            template = get_template(TEMPLATE_PATH)
         
-        # Load the template
-        template_path = os.path.join('static/generated_docs', 'template.docx')
-        doc = Document(template_path)
-
-        # Calculate total price of all items
-        total_price = sum(item.quantity * item.price for item in project.items)
+        # The cache key doubles as the ETag, so unchanged proposals revalidate with a 304
+        cache_key = proposal_cache_key(placeholders, items, template.digest)
+        if request.if_none_match.contains(cache_key):
+            response = app.response_class(status=304)
+            response.set_etag(cache_key)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.headers['Server-Timing'] = timer.server_timing()
+            observe_proposal_phases(timer, template)
+            return response
         
-        # Process address for new placeholders
-        street_address = ""
-        city_address = ""
-        if project.address:
-            # Split address by commas
-            parts = [p.strip() for p in project.address.split(',')]
-            if len(parts) >= 3:  # Make sure we have enough parts
-                street_address = parts[0]  # Everything before first comma
-                # Take everything between first and last comma (city, state, zip)
-                city_address = ', '.join(parts[1:-1])
+        cached = render_proposal(project.id, placeholders, cache_key, template, timer)
         
-        # Define placeholder mappings with variations
-        placeholders = {
-            '{{Name}}': project.name or '',
-            '{{Date}}': format_date(project.date) if project.date else '',
-            '{{Attn}}': project.attn or '',
-            '{{ContractorName}}': project.contractor_name or '',
-            '{{ContractorEmail}}': project.contractor_email or '',
-            '{{JobContact}}': project.job_contact or '',
-            '{{JobContactPhone}}': project.job_contact_phone or '',
-            '{{StreetAdd}}': street_address,
-            '{{CityAdd}}': city_address,
-            '{{TotalPrice}}': f"${total_price:,.2f}" if total_price else '',
-            # Also add variations with spaces
-            '{{ Name }}': project.name or '',
-            '{{ Date }}': format_date(project.date) if project.date else '',
-            '{{ Attn }}': project.attn or '',
-            '{{ ContractorName }}': project.contractor_name or '',
-            '{{ ContractorEmail }}': project.contractor_email or '',
-            '{{ JobContact }}': project.job_contact or '',
-            '{{ JobContactPhone }}': project.job_contact_phone or '',
-            '{{ StreetAdd }}': street_address,
-            '{{ CityAdd }}': city_address,
-            '{{ TotalPrice }}': f"${total_price:,.2f}" if total_price else '',
-        }
-
-        def find_placeholder(text):
-            """Find any placeholder in the text"""
-            for placeholder in placeholders:
-                if placeholder in text:
-                    print(f"Found placeholder: {placeholder} in text: {text}")  # Debug logging
-                    return placeholder
-            return None
-
-        def process_text(text, formatting_info=None):
-            """Process text and maintain formatting"""
-            if not text:
-                return text
-                
-            result = text
-            print(f"Processing text: {text}")  # Debug logging
-            
-            # Normalize the text for comparison
-            normalized_text = ''.join(text.split()).lower()  # Remove all whitespace and convert to lowercase
-            
-            # Check for contractor fields in normalized text
-            if 'contractorname' in normalized_text:
-                print(f"Found ContractorName in: {text}")  # Debug logging
-                value = project.contractor_name or ''
-                # Remove any curly braces around the value
-                if value.startswith('{{') and value.endswith('}}'):
-                    value = value[2:-2]
-                return value
-            
-            if 'contractoremail' in normalized_text:
-                print(f"Found ContractorEmail in: {text}")  # Debug logging
-                value = project.contractor_email or ''
-                # Remove any curly braces around the value
-                if value.startswith('{{') and value.endswith('}}'):
-                    value = value[2:-2]
-                return value
-            
-            # Handle other placeholders
-            for placeholder, value in placeholders.items():
-                if placeholder in text:
-                    print(f"Replacing {placeholder} with {value}")  # Debug logging
-                    # Remove any curly braces around the value
-                    if value.startswith('{{') and value.endswith('}}'):
-                        value = value[2:-2]
-                    result = result.replace(placeholder, value)
-            
-            return result
-
-        def process_paragraph(paragraph):
-            # First, collect all runs and their text
-            runs = paragraph.runs
-            if not runs:
-                return
-
-            # Get the full paragraph text and print it for debugging
-            full_text = paragraph.text
-            print(f"Processing paragraph text: {full_text}")  # Debug logging
-            
-            # Normalize the text for comparison
-            normalized_text = ''.join(full_text.split()).lower()  # Remove whitespace and convert to lowercase
-            
-            # Special handling for contractor fields
-            if 'contractorname' in normalized_text or 'contractoremail' in normalized_text:
-                # Process each run individually to maintain formatting
-                for run in runs:
-                    normalized_run = ''.join(run.text.split()).lower()
-                    if 'contractorname' in normalized_run:
-                        value = project.contractor_name or ''
-                        # Remove any curly braces around the value
-                        if value.startswith('{{') and value.endswith('}}'):
-                            value = value[2:-2]
-                        run.text = value
-                    elif 'contractoremail' in normalized_run:
-                        value = project.contractor_email or ''
-                        # Remove any curly braces around the value
-                        if value.startswith('{{') and value.endswith('}}'):
-                            value = value[2:-2]
-                        run.text = value
-                return
-
-            # Check if there are any other placeholders in the full text
-            has_placeholders = any(p in full_text for p in placeholders)
-            if not has_placeholders:
-                return
+        with timer.phase('send'):
+            response = send_proposal(cached, cache_key, f'{project.name}.docx')
+        response.headers['Server-Timing'] = timer.server_timing()
+        observe_proposal_phases(timer, template)
+        return response
+        
+    except Exception as e:
+        print(f"Error generating Word document: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-            # Store formatting information for each character position
-            formatting = []
-            current_pos = 0
-            
-            for run in runs:
-                print(f"Run text: {run.text}")  # Debug logging
-                for _ in range(len(run.text)):
-                    formatting.append({
-                        'bold': run.bold,
-                        'italic': run.italic,
-                        'underline': run.underline,
-                        'font_size': run.font.size,
-                        'font_name': run.font.name,
-                        'style': run.style
-                    })
-                current_pos += len(run.text)
-
-            # Replace all placeholders in the full text
-            new_text = process_text(full_text)
-            print(f"Text after replacement: {new_text}")  # Debug logging
-
-            # Clear the paragraph
-            paragraph.clear()
-
-            # Add the text back with original formatting
-            if len(formatting) > 0:
-                current_format = formatting[0]
-                current_text = ""
-
-                for i, char in enumerate(new_text):
-                    # If we have formatting information for this position and it's different
-                    # from current format, create a new run
-                    if i < len(formatting) and (
-                        formatting[i]['bold'] != current_format['bold'] or
-                        formatting[i]['italic'] != current_format['italic'] or
-                        formatting[i]['underline'] != current_format['underline'] or
-                        formatting[i]['font_size'] != current_format['font_size'] or
-                        formatting[i]['font_name'] != current_format['font_name']
-                    ):
-                        if current_text:
-                            run = paragraph.add_run(current_text)
-                            apply_format(run, current_format)
-                            current_text = ""
-                        current_format = formatting[i]
-
-                    current_text += char
-
-                # Add any remaining text
-                if current_text:
-                    run = paragraph.add_run(current_text)
-                    apply_format(run, current_format)
-
-        def apply_format(run, format_dict):
-            """Apply stored formatting to a run"""
-            run.bold = format_dict['bold']
-            run.italic = format_dict['italic']
-            run.underline = format_dict['underline']
-            if format_dict['font_size']:
-                run.font.size = format_dict['font_size']
-            if format_dict['font_name']:
-                run.font.name = format_dict['font_name']
-            if format_dict['style']:
-                run.style = format_dict['style']
-
-        def process_table_cell(cell):
-            """Process all paragraphs in a table cell"""
-            for paragraph in cell.paragraphs:
-                process_paragraph(paragraph)
-
-        def process_shapes():
-            """Process text in shapes and textboxes"""
-            # Get all shapes from the document
-            for shape in doc.inline_shapes:
-                try:
-                    # Try to access the textframe if it exists
-                    if hasattr(shape, '_inline') and hasattr(shape._inline, 'graphic'):
-                        # Access the shape's text frame
-                        text_frame = shape._inline.graphic.graphicData.find('.//{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}txbx')
-                        if text_frame is not None:
-                            # Process each paragraph in the text frame
-                            for paragraph in text_frame.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}p'):
-                                # Get all text elements in this paragraph
-                                text_elements = paragraph.findall('.//{http://schemas.openxmlformats.org/wordprocessingml/2006/main}t')
-                                if text_elements:
-                                    # Combine all text elements to get the full text
-                                    full_text = ''.join(elem.text or '' for elem in text_elements)
-                                    print(f"Processing textbox full text: {full_text}")  # Debug logging
-                                    
-                                    # Check for contractor fields
-                                    if 'ContractorName' in full_text:
-                                        new_text = project.contractor_name or ''
-                                        # Set the text in the first element and clear the others
-                                        text_elements[0].text = new_text
-                                        for elem in text_elements[1:]:
-                                            elem.text = ''
-                                    elif 'ContractorEmail' in full_text:
-                                        new_text = project.contractor_email or ''
-                                        # Set the text in the first element and clear the others
-                                        text_elements[0].text = new_text
-                                        for elem in text_elements[1:]:
-                                            elem.text = ''
-                                    else:
-                                        # Handle other placeholders
-                                        new_text = process_text(full_text)
-                                        text_elements[0].text = new_text
-                                        for elem in text_elements[1:]:
-                                            elem.text = ''
-                except Exception as e:
-                    print(f"Error processing shape: {str(e)}")
-                    continue
+@app.route('/generate_word/<int:project_id>/async', methods=['POST'])
+@login_required
+def generate_word_async(project_id):
+    """Queue a proposal render and return a job id to poll"""
+    project = Project.query.get_or_404(project_id)
+    
+    # Check if the project belongs to the current user
+    if project.user_id != current_user.id and not current_user.is_admin:
+        return jsonify({'success': False, 'error': 'Permission denied'}), 403
+    
+    try:
+        # Snapshot everything the render needs so the worker never touches the database
+        placeholders = proposal_values(project)
+        template = get_template(TEMPLATE_PATH)
+        cache_key = proposal_cache_key(placeholders, project.items, template.digest)
+        
+        def render():
+            render_proposal(project_id, placeholders, cache_key, template, mode='async')
+            return cache_key
+        
+        job = render_queue.submit(project.id, f'{project.name}.docx', render)
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status_url': url_for('proposal_job_status', job_id=job.id),
+            'download_url': url_for('proposal_job_download', job_id=job.id)
+        }), 202
+    except QueueFullError as e:
+        response = jsonify({'success': False, 'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    except Exception as e:
+        app.logger.error(f"Error queueing proposal: {str(e)}")
+        return jsonify({'success': False, 'error': 'An error occurred while queueing the proposal'}), 500
+
+def get_own_job(job_id):
+    """Look up a render job, aborting unless it belongs to one of the user's projects"""
+    job = render_queue.get(job_id)
+    if job is None:
+        abort(404)
+    project = Project.query.get_or_404(job.project_id)
+    if project.user_id != current_user.id and not current_user.is_admin:
+        abort(404)
+    return job
 
-            # Process floating shapes (if any)
-            body = doc._body._body
-            for shape in body.findall('.//w:drawing', {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}):
-                try:
-                    # Try to find textboxes in the shape
-                    textboxes = shape.findall('.//wps:txbx//w:p', {
-                        'wps': 'http://schemas.microsoft.com/office/word/2010/wordprocessingShape',
-                        'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
-                    })
-                    
-                    for textbox in textboxes:
-                        # Get all text elements in this textbox
-                        text_elements = textbox.findall('.//w:t', {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'})
-                        if text_elements:
-                            # Combine all text elements to get the full text
-                            full_text = ''.join(elem.text or '' for elem in text_elements)
-                            print(f"Processing textbox full text: {full_text}")  # Debug logging
-                            
-                            # Check for contractor fields
-                            if 'ContractorName' in full_text:
-                                new_text = project.contractor_name or ''
-                                # Set the text in the first element and clear the others
-                                text_elements[0].text = new_text
-                                for elem in text_elements[1:]:
-                                    elem.text = ''
-                            elif 'ContractorEmail' in full_text:
-                                new_text = project.contractor_email or ''
-                                # Set the text in the first element and clear the others
-                                text_elements[0].text = new_text
-                                for elem in text_elements[1:]:
-                                    elem.text = ''
-                            else:
-                                # Handle other placeholders
-                                new_text = process_text(full_text)
-                                text_elements[0].text = new_text
-                                for elem in text_elements[1:]:
-                                    elem.text = ''
-                except Exception as e:
-                    print(f"Error processing floating shape: {str(e)}")
-                    continue
+@app.route('/proposal_jobs/<job_id>')
+@login_required
+@limiter.exempt
+def proposal_job_status(job_id):
+    """Report a render job's status; ?wait=N long-polls for up to N seconds"""
+    job = get_own_job(job_id)
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    if wait > 0:
+        job = render_queue.get(job_id, wait) or job
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/proposal_jobs/<job_id>/download')
+@login_required
+def proposal_job_download(job_id):
+    job = get_own_job(job_id)
+    if job.status != 'done':
+        return jsonify({'success': False, 'status': job.status, 'error': job.error or 'The proposal is not ready yet'}), 409
+    
+    cached = proposal_cache.get(job.cache_key)
+    if cached is None:
+        return jsonify({'success': False, 'error': 'The proposal has expired, please generate it again'}), 410
+    return send_proposal(cached, job.cache_key, job.download_name)
+
+def select_export_projects(project_ids=None, user_id=None, since=None, until=None):
+    """Find the projects for a bulk export, by explicit ids or by owner and creation date"""
+    query = Project.query
+    if project_ids:
+        query = query.filter(Project.id.in_(project_ids))
+    if user_id is not None:
+        query = query.filter(Project.user_id == user_id)
+    if since is not None:
+        query = query.filter(Project.created_at >= since)
+    if until is not None:
+        query = query.filter(Project.created_at < until + timedelta(days=1))
+    return query.order_by(Project.id).all()
+
+def proposal_export_entries(projects):
+    """Snapshot archive names and placeholder values, with the cache key of each proposal"""
+    template = get_template(TEMPLATE_PATH)
+    entries = []
+    cache_keys = {}
+    for project in projects:
+        name = f"{secure_filename(project.name or '') or 'proposal'}_{project.id}.docx"
+        placeholders = proposal_values(project)
+        entries.append((name, placeholders))
+        cache_keys[name] = proposal_cache_key(placeholders, project.items, template.digest)
+    return entries, cache_keys
+
+def read_cached_proposal(cache_key):
+    """A cached proposal's bytes, read from disk if that is where it is, or None on a miss"""
+    hit = proposal_cache.get(cache_key)
+    if isinstance(hit, str):
+        try:
+            with open(hit, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None  # Evicted since the lookup
+    return hit
+
+def parse_export_date(value, field_name):
+    """Parse an optional YYYY-MM-DD export filter date"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValidationError(f"{field_name} must be a date in YYYY-MM-DD format")
 
-        # Process all paragraphs in the main document
-        for paragraph in doc.paragraphs:
-            process_paragraph(paragraph)
+@app.route('/export_proposals', methods=['POST'])
+@login_required
+def export_proposals():
+    """Stream a ZIP of proposals for a list of project ids or a user/date filter"""
+    try:
+        data = request.get_json(silent=True) or request.form
+        project_ids = data.get('project_ids') or []
+        if isinstance(project_ids, str):
+            project_ids = [part for part in project_ids.split(',') if part.strip()]
+        project_ids = [int(project_id) for project_id in project_ids]
         
-        # Process all tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    process_table_cell(cell)
-
-        # Process shapes and textboxes
-        process_shapes()
+        user_id = data.get('user_id')
+        user_id = int(user_id) if user_id not in (None, '') else None
+        since = parse_export_date(data.get('since'), "Start date")
+        until = parse_export_date(data.get('until'), "End date")
+        if not project_ids and user_id is None and since is None and until is None:
+            raise ValidationError("Select projects by id or by user and date")
         
-        # Create output filename with timestamp
-        output_filename = f'output_{project.name}_{int(time.time())}.docx'
-        output_path = os.path.join('static/generated_docs', output_filename)
+        # Only administrators may export other users' projects
+        if not current_user.is_admin:
+            if user_id not in (None, current_user.id):
+                return jsonify({'success': False, 'error': 'Permission denied'}), 403
+            user_id = current_user.id
         
-        # Save the modified document
-        doc.save(output_path)
+        projects = select_export_projects(project_ids, user_id, since, until)
+        if not projects:
+            return jsonify({'success': False, 'error': 'No projects match the selection'}), 404
         
-        # Send the generated file
-        response = send_file(
-            output_path,
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            as_attachment=True,
-            download_name=f'{project.name}.docx'
+        entries, cache_keys = proposal_export_entries(projects)
+        workers = int(os.getenv('PROPOSAL_EXPORT_WORKERS', '0')) or None
+        response = app.response_class(
+            stream_proposal_zip(entries, TEMPLATE_PATH, max_workers=workers,
+                                cache_keys=cache_keys, read_cached=read_cached_proposal),
+            mimetype='application/zip'
         )
-        
-        # Clean up the generated file after sending
-        @response.call_on_close
-        def cleanup():
-            try:
-                # Wait a short time to ensure the file is fully sent
-                time.sleep(0.5)
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                    print(f"Successfully cleaned up {output_path}")
-                else:
-                    print(f"File {output_path} already removed or does not exist")
-            except Exception as e:
-                print(f"Error cleaning up {output_path}: {str(e)}")
-                # Try again after a delay in case the file is still in use
-                try:
-                    time.sleep(1)
-                    if os.path.exists(output_path):
-                        os.remove(output_path)
-                        print(f"Successfully cleaned up {output_path} on second attempt")
-                except Exception as e2:
-                    print(f"Failed to clean up {output_path} on second attempt: {str(e2)}")
-        
-        # Schedule a delayed cleanup task as a backup
-        def delayed_cleanup():
-            time.sleep(5)  # Wait 5 seconds after response is sent
-            try:
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                    print(f"Successfully cleaned up {output_path} with delayed cleanup")
-            except Exception as e:
-                print(f"Error in delayed cleanup for {output_path}: {str(e)}")
-        
-        # Start the delayed cleanup in a separate thread
-        cleanup_thread = threading.Thread(target=delayed_cleanup)
-        cleanup_thread.daemon = True
-        cleanup_thread.start()
-        
+        response.headers['Content-Disposition'] = f'attachment; filename=proposals_{datetime.now():%Y%m%d_%H%M%S}.zip'
         return response
-        
+    except (ValidationError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"Error generating Word document: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        app.logger.error(f"Error exporting proposals: {str(e)}")
+        return jsonify({'success': False, 'error': 'An error occurred while exporting proposals'}), 500
+
+@app.cli.command('export-proposals')
+@click.option('--ids', help='Comma-separated project ids')
+@click.option('--user', 'username', help='Only projects owned by this username')
+@click.option('--since', help='Only projects created on or after YYYY-MM-DD')
+@click.option('--until', help='Only projects created on or before YYYY-MM-DD')
+@click.option('--workers', type=int, default=None, help='Render processes (defaults to the CPU count)')
+@click.option('--output', '-o', default='proposals.zip', show_default=True, help='ZIP file to write')
+def export_proposals_command(ids, username, since, until, workers, output):
+    """Render proposals for many projects into a ZIP file."""
+    project_ids = [int(part) for part in ids.split(',') if part.strip()] if ids else []
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"Unknown user {username}")
+        user_id = user.id
+    
+    try:
+        projects = select_export_projects(project_ids, user_id,
+                                          parse_export_date(since, "--since"),
+                                          parse_export_date(until, "--until"))
+    except ValidationError as e:
+        raise click.ClickException(str(e))
+    if not projects:
+        raise click.ClickException("No projects match the selection")
+    
+    entries, cache_keys = proposal_export_entries(projects)
+    start_time = time.perf_counter()
+    with open(output, 'wb') as f:
+        for chunk in stream_proposal_zip(entries, TEMPLATE_PATH, max_workers=workers,
+                                         cache_keys=cache_keys, read_cached=read_cached_proposal):
+            f.write(chunk)
+    elapsed = time.perf_counter() - start_time
+    click.echo(f"Exported {len(entries)} proposals to {output} in {elapsed:.2f}s")
+
+@app.cli.command('reprice-items')
+@click.option('--unsent-only', is_flag=True, help="Leave projects whose proposal was sent alone")
+def reprice_items_command(unsent_only):
+    """Update saved item prices to the current price snapshot."""
+    snapshot = price_cache.snapshot
+    if not snapshot.version:
+        snapshot = price_cache.refresh()
+    if not snapshot.prices:
+        raise click.ClickException("No prices are available")
+    
+    prices = {name: snapshot.prices[name] for name in saved_item_names() if name in snapshot.prices}
+    start_time = time.perf_counter()
+    result = reprice_items(prices, unsent_only=unsent_only, rules=pricing_rules())
+    db.session.commit()
+    for project_id in result.project_ids:
+        proposal_cache.invalidate(project_id)
+    elapsed = time.perf_counter() - start_time
+    click.echo(f"Re-priced {result.summary()} from price version {snapshot.version} in {elapsed:.2f}s")
+
+@app.cli.command('process-item-images')
+def process_item_images_command():
+    """Store catalog images uploaded before thumbnails existed under their content hash."""
+    folder = app.config['UPLOAD_FOLDER']
+    processed = 0
+    for entry in catalog.snapshot.sorted:
+        if not entry.image_path or is_hashed(image_filename(entry.image_path)):
+            continue
+        path = os.path.join(folder, image_filename(entry.image_path))
+        if not os.path.exists(path):
+            click.echo(f"Skipped {entry.name}: {path} not found")
+            continue
+        with open(path, 'rb') as f:
+            upload = UploadFile.copy_from(f, upload_directory(app))
+        try:
+            image_path = store_item_image(upload, path.rsplit('.', 1)[-1], folder)
+        except ValidationError as e:
+            click.echo(f"Skipped {entry.name}: {str(e)}")
+            continue
+        finally:
+            upload.close()
+        catalog.update(entry.name, entry.name, image_path)
+        release_item_image(entry.image_path)
+        processed += 1
+    click.echo(f"Processed {processed} item images")
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Expose process metrics in the Prometheus text format"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/admin')
 @login_required
@@ -968,18 +1150,17 @@ def admin():
         flash('You do not have permission to access the admin area.', 'error')
         return redirect(url_for('index'))
     
-    return render_template('admin.html', items=ITEMS)
+    return render_template('admin.html', items=catalog.snapshot.sorted)
 
 @app.route('/admin/items/add', methods=['POST'])
 def admin_add_item():
-    global ITEMS
     name = request.form.get('name')
     
     try:
         # Validate the name
         name = validate_string(name, "Item name", max_length=100)
         
-        if name in [item.name for item in ITEMS]:
+        if name in catalog:
             return jsonify({'success': False, 'error': 'Item with this name already exists'}), 400
         
         # Validate the image file
@@ -992,36 +1173,36 @@ def admin_add_item():
         
         image_path = None
         if image:
-            filename = secure_filename(image.filename)
-            # Add timestamp to filename to prevent duplicates
-            filename = f"{int(time.time())}_{filename}"
-            image_path = os.path.join('/static/item_images', filename)  # Add /static/ prefix
-            image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            # Stored once under its content hash, with thumbnail and preview variants
+            image_path = store_item_image(as_upload(image), secure_filename(image.filename).rsplit('.', 1)[1],
+                                          app.config['UPLOAD_FOLDER'])
         
-        ITEMS.append(ItemDefinition(name, image_path))
-        ITEMS.sort(key=lambda x: x.name)  # Keep items sorted by name
-        save_items_to_file()
+        catalog.add(name, image_path)
         return jsonify({'success': True})
     except ValidationError as e:
         return jsonify({'success': False, 'error': str(e)}), 400
+    except (CatalogConflictError, IntegrityError):
+        # Added by another worker since this one last synced the catalog
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Item with this name already exists'}), 400
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error adding item: {str(e)}")
         return jsonify({'success': False, 'error': 'An error occurred while adding the item'}), 500
 
 @app.route('/admin/items/edit', methods=['POST'])
 def admin_edit_item():
-    global ITEMS
     try:
         old_name = validate_string(request.form.get('oldName'), "Old item name", max_length=100)
         new_name = validate_string(request.form.get('newName'), "New item name", max_length=100)
         keep_image = request.form.get('keepImage') == 'true'
         
-        old_item = next((item for item in ITEMS if item.name == old_name), None)
+        old_item = catalog.get(old_name)
         if not old_item:
             return jsonify({'success': False, 'error': 'Item not found'}), 404
             
         # Only check for name conflict if the name is actually changing
-        if new_name != old_name and new_name in [item.name for item in ITEMS if item.name != old_name]:
+        if new_name != old_name and new_name in catalog:
             return jsonify({'success': False, 'error': 'Name already exists'}), 400
 
         # Validate the image file
@@ -1036,67 +1217,53 @@ def admin_edit_item():
         # Handle image update
         image_path = old_item.image_path if keep_image else None
         if image:
-            # Delete old image if exists
-            if old_item.image_path:
-                old_image_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(old_item.image_path))
-                if os.path.exists(old_image_path):
-                    os.remove(old_image_path)
-            
-            filename = secure_filename(image.filename)
-            filename = f"{int(time.time())}_{filename}"
-            image_path = os.path.join('/static/item_images', filename)  # Add /static/ prefix
-            image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        elif not keep_image and old_item.image_path:
-            # Delete old image if exists and not keeping it
-            old_image_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(old_item.image_path))
-            if os.path.exists(old_image_path):
-                os.remove(old_image_path)
-        
-        # Update the item
-        old_item.name = new_name
-        old_item.image_path = image_path
+            image_path = store_item_image(as_upload(image), secure_filename(image.filename).rsplit('.', 1)[1],
+                                          app.config['UPLOAD_FOLDER'])
         
-        # Save changes
-        ITEMS.sort(key=lambda x: x.name)  # Keep items sorted by name
-        save_items_to_file()
+        # Update the item, then delete the old image unless it is still in use
+        catalog.update(old_name, new_name, image_path)
+        if old_item.image_path != image_path:
+            release_item_image(old_item.image_path)
         
         return jsonify({'success': True})
     except ValidationError as e:
         return jsonify({'success': False, 'error': str(e)}), 400
+    except (CatalogConflictError, IntegrityError):
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Name already exists'}), 400
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error editing item: {str(e)}")
         return jsonify({'success': False, 'error': 'An error occurred while editing the item'}), 500
 
 @app.route('/admin/items/delete', methods=['POST'])
 def admin_delete_item():
-    global ITEMS
     try:
         name = validate_string(request.form.get('name'), "Item name", max_length=100)
         
-        item_to_delete = next((item for item in ITEMS if item.name == name), None)
+        item_to_delete = catalog.get(name)
         if not item_to_delete:
             return jsonify({'success': False, 'error': 'Item not found'}), 404
         
-        # Delete image file if exists
-        if item_to_delete.image_path:
-            image_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(item_to_delete.image_path))
-            if os.path.exists(image_path):
-                os.remove(image_path)
-        
-        # Remove item from list
-        ITEMS = [item for item in ITEMS if item.name != name]
-        save_items_to_file()
+        # Remove item from the catalog, then its image unless another item shares it
+        catalog.remove(name)
+        release_item_image(item_to_delete.image_path)
         
         return jsonify({'success': True})
     except ValidationError as e:
         return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         app.logger.error(f"Error deleting item: {str(e)}")
         return jsonify({'success': False, 'error': 'An error occurred while deleting the item'}), 500
 
 # Function to immediately clean up all temporary files
 def cleanup_all_temp_files():
-    """Clean up all temporary document files regardless of age"""
+    """Clean up all temporary document files regardless of age
+
+    Proposals are streamed from memory, so this only removes output files
+    left behind by older versions of the app.
+    """
     try:
         with cleanup_lock:
             docs_dir = 'static/generated_docs'
@@ -1147,25 +1314,39 @@ def admin_cleanup_temp_files():
 @app.route('/get_items_info', methods=['GET'])
 def get_items_info():
     """Return a list of all items with their info (name, image_path)"""
-    try:
-        # Convert the ITEMS list to a JSON-friendly format
-        items_data = []
-        for item in ITEMS:
-            items_data.append({
-                'name': item.name,
-                'image_path': item.image_path
-            })
-        
-        return jsonify({
-            'success': True,
-            'items': items_data
-        })
-    except Exception as e:
-        print(f"Error getting items info: {str(e)}")
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        })
+    # Served from the catalog snapshot's precomputed JSON
+    snapshot = catalog.snapshot
+    if request.if_none_match.contains(snapshot.etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(snapshot.items_json, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Most catalog matches one /search_items request may return
+MAX_SEARCH_RESULTS = 50
+
+# The project page searches as the user types, which the default request limits
+# would cut off within a few lookups, so searching is for logged-in users only
+@app.route('/search_items', methods=['GET'])
+@login_required
+@limiter.exempt
+def search_items():
+    """
+    Catalog entries matching ?q=, best first, with their image paths.
+
+    Names starting with the query come first, then names with a word
+    starting with each word of the query. ?limit= caps the matches
+    (default 10, at most MAX_SEARCH_RESULTS).
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= MAX_SEARCH_RESULTS:
+        return jsonify({'success': False, 'error': f'limit must be between 1 and {MAX_SEARCH_RESULTS}'}), 400
+    snapshot = catalog.snapshot
+    items = [snapshot.entries[name].as_dict() for name in snapshot.search.search(query, limit)]
+    return jsonify({'success': True, 'version': snapshot.version, 'items': items})
 
 @app.route('/api/places/autocomplete', methods=['GET'])
 def places_autocomplete():
@@ -1275,11 +1456,16 @@ def csp_violations():
 
 # Initialize authentication after database setup
 with app.app_context():
+    new_catalog = not db.inspect(db.engine).has_table(CatalogItem.__tablename__)
     # Create all tables if they don't exist
     db.create_all()
+    # A catalog table created here starts from items.txt, as the migration does
+    if new_catalog:
+        catalog.import_file(ITEMS_FILE)
+    catalog.load()
     # No need to initialize auth again, it's already done above
 
 if __name__ == '__main__':
-    # Initial price cache update
-    update_price_cache()
+    # Load prices before serving the first page
+    price_cache.refresh()
     app.run(debug=os.getenv('FLASK_ENV') == 'development', port=8000)
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Benchmark the catalog search index.
+
+Builds a SearchIndex over synthetic SKU-like item names at each catalog
+size, then measures lookups for a mix of one-word, several-word and
+whole-name prefix queries, the incremental update for a single edit, and
+the client-side approach of filtering every name. Prints the results as
+JSON.
+
+Usage (from the repository root):
+    python benchmarks/bench_catalog_search.py --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_search import SearchIndex, tokenize
+
+MATERIALS = ['Copper', 'Brass', 'PVC', 'Steel', 'Galvanized', 'Stainless', 'CPVC', 'PEX', 'Cast Iron', 'ABS']
+PARTS = ['Pipe', 'Elbow', 'Tee', 'Coupling', 'Valve', 'Cap', 'Union', 'Adapter', 'Flange', 'Bushing',
+         'Nipple', 'Reducer', 'Plug', 'Strainer', 'Hanger']
+SIZES = ['1/4"', '3/8"', '1/2"', '3/4"', '1"', '1-1/4"', '1-1/2"', '2"', '3"', '4"']
+
+def item_names(count, generator):
+    names = set()
+    while len(names) < count:
+        names.add(f'{generator.choice(MATERIALS)} {generator.choice(PARTS)} {generator.choice(SIZES)} '
+                  f'SKU{generator.randrange(10 ** 7):07d}')
+    return sorted(names)
+
+def queries(names, generator, count):
+    """Prefixes a person would type into the picker"""
+    mix = []
+    for _ in range(count):
+        name = generator.choice(names)
+        words = tokenize(name)
+        kind = generator.randrange(4)
+        if kind == 0:
+            mix.append(words[1][:3])  # Start of one word
+        elif kind == 1:
+            mix.append(f'{words[0][:4]} {words[1][:2]}')  # Starts of two words
+        elif kind == 2:
+            mix.append(name[:len(name) // 2])  # Start of the whole name
+        else:
+            mix.append(words[-1][:6])  # Part of a SKU
+    return mix
+
+def timed(function, *args):
+    began = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - began
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--scan-queries', type=int, default=20, help='Queries run by the full filter')
+    args = parser.parse_args()
+
+    generator = random.Random(1)
+    results = []
+    for size in args.sizes:
+        names = item_names(size, generator)
+        index, build_seconds = timed(SearchIndex, names)
+
+        mix = queries(names, generator, args.queries)
+        latencies = []
+        for query in mix:
+            _, seconds = timed(index.search, query, args.limit)
+            latencies.append(seconds * 1e6)
+        latencies.sort()
+
+        # One edit: a name removed and another added
+        edited = f'{names[0]} Lead Free'
+        _, update_seconds = timed(index.updated, names, [edited], [names[0]])
+
+        def scan(query):
+            terms = tokenize(query)
+            return [name for name in names
+                    if all(any(word.startswith(term) for word in tokenize(name)) for term in terms)][:args.limit]
+        scans = [timed(scan, query)[1] for query in mix[:args.scan_queries]]
+
+        results.append({
+            'entries': size,
+            'build_seconds': round(build_seconds, 3),
+            'update_ms': round(update_seconds * 1000, 2),
+            'search_us': {'p50': round(statistics.median(latencies), 1),
+                          'p99': round(latencies[int(len(latencies) * 0.99) - 1], 1),
+                          'max': round(latencies[-1], 1)},
+            'full_filter_ms': round(statistics.median(scans) * 1000, 1),
+        })
+    print(json.dumps({'limit': args.limit, 'queries': args.queries, 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
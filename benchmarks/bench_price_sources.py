@@ -0,0 +1,110 @@
+"""
+Benchmark loading large price tables from each local price source.
+
+Generates a realistic price table (default 100,000 rows, "$1,234.50"
+style prices) as a CSV file and a SQLite database, then times a full
+load through CsvPriceSource and SqlitePriceSource, the row-by-row parser
+get_sheet_data used before, and building the served snapshot. Prints
+the results as JSON.
+
+Pass --keep DIR to keep the generated files, then load-test the app
+offline against them:
+    PRICE_SOURCE=csv PRICE_SOURCE_PATH=DIR/prices.csv flask run
+
+Usage (from the repository root):
+    python benchmarks/bench_price_sources.py --rows 100000
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_cache import PriceSnapshot
+from price_sources import CsvPriceSource, SqlitePriceSource
+
+def generate_rows(count, seed=1):
+    """Item names and formatted prices like the spreadsheet's"""
+    generator = random.Random(seed)
+    kinds = ['Curb', 'Pipe Boot', 'Flashing', 'Drain', 'Membrane', 'Hatch', 'Skylight', 'Vent']
+    return [(f'{kinds[index % len(kinds)]} {index:06d}', f'${generator.uniform(1, 25000):,.2f}')
+            for index in range(count)]
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Item', 'Price'])
+        writer.writerows(rows)
+
+def write_sqlite(path, rows):
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE prices (name TEXT PRIMARY KEY, price REAL NOT NULL)')
+    db.executemany('INSERT INTO prices VALUES (?, ?)',
+                   ((name, float(price.replace('$', '').replace(',', ''))) for name, price in rows))
+    db.commit()
+    db.close()
+
+def legacy_parse(values):
+    """The row-by-row parser get_sheet_data used before"""
+    prices = {}
+    for row in values[1:]:
+        if len(row) >= 2:
+            try:
+                item_name = row[0].strip()
+                price = float(row[1].strip().replace('$', '').replace(',', ''))
+                prices[item_name] = price
+            except (ValueError, IndexError) as e:
+                print(f"Error processing row {row}: {e}")
+                continue
+    return prices
+
+def timed(function, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - began)
+    return result, {'median_ms': round(statistics.median(timings) * 1000, 2),
+                    'min_ms': round(min(timings) * 1000, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--keep', help='Write the generated files to this directory and keep them')
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows)
+    with tempfile.TemporaryDirectory() as scratch:
+        directory = args.keep or scratch
+        os.makedirs(directory, exist_ok=True)
+        csv_path = os.path.join(directory, 'prices.csv')
+        sqlite_path = os.path.join(directory, 'prices.db')
+        for path in (csv_path, sqlite_path):
+            if os.path.exists(path):
+                os.remove(path)
+        write_csv(csv_path, rows)
+        write_sqlite(sqlite_path, rows)
+
+        sheet_values = [['Item', 'Price']] + [list(row) for row in rows]
+        results = {'rows': args.rows, 'cases': {}}
+        prices, results['cases']['legacy_row_parser'] = timed(lambda: legacy_parse(sheet_values), args.repeat)
+        for name, source in (('csv', CsvPriceSource(csv_path)), ('sqlite', SqlitePriceSource(sqlite_path))):
+            loaded, results['cases'][name] = timed(source.load, args.repeat)
+            if loaded != prices:
+                raise RuntimeError(f'{name} source loaded different prices')
+        snapshot, results['cases']['snapshot'] = timed(lambda: PriceSnapshot(1, prices, time.time()), args.repeat)
+        results['snapshot_json_bytes'] = len(snapshot.table_json)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark the vectorized pricing engine.
+
+Prices a synthetic set of line items spread over many projects, with
+quantity breaks on a share of the item names, a markup and tax, and
+compares it with a per-line Decimal loop over a sample of the same lines
+(checking that both give the same cents). Prints the results as JSON.
+
+Usage (from the repository root):
+    python benchmarks/bench_pricing.py --lines 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pricing import PricingRules, TierTable, price_lines, to_cents
+
+def reference_totals(names, quantities, prices, projects, project_count, tiers, markup_bp, tax_bp):
+    """Per-line Decimal pricing, the way a loop over ORM items would do it"""
+    cent = Decimal('0.01')
+    markup = 1 + Decimal(markup_bp) / 10000
+    tax = Decimal(tax_bp) / 10000
+    subtotals = [Decimal(0)] * project_count
+    for name, quantity, price, project in zip(names, quantities, prices, projects):
+        unit = Decimal(str(price))
+        for minimum, tier_price in tiers.get(name, ()):
+            if quantity >= minimum:
+                unit = Decimal(str(tier_price))
+        unit = (unit * markup).quantize(cent, rounding=ROUND_HALF_UP)
+        subtotals[project] += unit * quantity
+    return [int(((subtotal + (subtotal * tax).quantize(cent, rounding=ROUND_HALF_UP)) * 100))
+            for subtotal in subtotals]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=1000000)
+    parser.add_argument('--lines-per-project', type=int, default=50)
+    parser.add_argument('--names', type=int, default=5000, help='Distinct item names')
+    parser.add_argument('--tiered', type=float, default=0.3, help='Share of names with quantity breaks')
+    parser.add_argument('--markup', type=int, default=1250, help='Markup in basis points')
+    parser.add_argument('--tax', type=int, default=825, help='Tax in basis points')
+    parser.add_argument('--sample', type=int, default=100000, help='Lines priced by the Decimal loop')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    generator = random.Random(1)
+    catalog = [f'Item {index:05d}' for index in range(args.names)]
+    base = {name: round(generator.uniform(1, 5000), 2) for name in catalog}
+    tiers = {}
+    for name in generator.sample(catalog, int(args.names * args.tiered)):
+        tiers[name] = [(minimum, round(base[name] * (1 - step * 0.05), 2))
+                       for step, minimum in enumerate((10, 50, 100), start=1)]
+
+    project_count = max(1, args.lines // args.lines_per_project)
+    names = [generator.choice(catalog) for _ in range(args.lines)]
+    quantities = [generator.randint(1, 150) for _ in range(args.lines)]
+    prices = [base[name] for name in names]
+    projects = [index % project_count for index in range(args.lines)]
+
+    began = time.perf_counter()
+    table = TierTable(tiers)
+    rules = PricingRules(args.markup, args.tax, table)
+    build_seconds = time.perf_counter() - began
+
+    began = time.perf_counter()
+    columns = (np.asarray(quantities, dtype=np.int64), to_cents(prices), table.group_of(names),
+               np.asarray(projects, dtype=np.int64))
+    columns_seconds = time.perf_counter() - began
+
+    timings = []
+    for _ in range(args.repeat):
+        began = time.perf_counter()
+        result = price_lines(*columns[:3], rules, projects=columns[3], project_count=project_count)
+        timings.append(time.perf_counter() - began)
+
+    sample = min(args.sample, args.lines)
+    sample_projects = max(1, sample // args.lines_per_project)
+    began = time.perf_counter()
+    expected = reference_totals(names[:sample], quantities[:sample], prices[:sample],
+                                [project % sample_projects for project in projects[:sample]],
+                                sample_projects, {name: sorted(breaks) for name, breaks in tiers.items()},
+                                args.markup, args.tax)
+    reference_seconds = time.perf_counter() - began
+    sampled = price_lines(*(column[:sample] for column in columns[:3]), rules,
+                          projects=columns[3][:sample] % sample_projects, project_count=sample_projects)
+
+    results = {
+        'lines': args.lines,
+        'projects': project_count,
+        'tiered_names': len(tiers),
+        'tier_table_seconds': round(build_seconds, 4),
+        'columns_seconds': round(columns_seconds, 3),
+        'price_lines_seconds': {'best': round(min(timings), 4), 'worst': round(max(timings), 4)},
+        'lines_per_second': int(args.lines / min(timings)),
+        'grand_total': f'${int(result.total_cents.sum()) / 100:,.2f}',
+        'decimal_loop': {
+            'lines': sample,
+            'seconds': round(reference_seconds, 3),
+            'lines_per_second': int(sample / reference_seconds),
+            'matches': sampled.total_cents.tolist() == expected,
+        },
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+Benchmark proposal generation across template and project sizes.
+
+Builds synthetic templates with increasing numbers of paragraphs, tables,
+inline shapes and floating textboxes plus a line-item table, renders them
+for projects with 1 to 1,000 items, and prints p50/p95/p99 latency,
+throughput and peak RSS as JSON. Each case runs in a fresh process so its peak RSS is its own.
+
+Usage (from the repository root):
+    python benchmarks/bench_proposals.py --output bench.json
+    python benchmarks/bench_proposals.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_proposals.py --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEMPLATE_SIZES = {
+    'small': {'paragraphs': 50, 'tables': 2, 'inline_shapes': 2, 'textboxes': 2},
+    'medium': {'paragraphs': 500, 'tables': 10, 'inline_shapes': 10, 'textboxes': 10},
+    'large': {'paragraphs': 2000, 'tables': 40, 'inline_shapes': 40, 'textboxes': 40},
+}
+ITEM_COUNTS = [1, 10, 100, 1000]
+
+PLACEHOLDERS = ['Name', 'Date', 'Attn', 'ContractorName', 'ContractorEmail',
+                'JobContact', 'JobContactPhone', 'StreetAdd', 'CityAdd', 'TotalPrice']
+
+BOILERPLATE = ('Tie-In / Flash new Roof Top Units with roofing membrane compatible with existing '
+               'roofing material. Install pipe boots for penetrations associated with the units. ')
+
+TEXTBOX_XML = '''
+<w:r xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+     xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+     xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"
+     xmlns:wps="http://schemas.microsoft.com/office/word/2010/wordprocessingShape">
+  <w:drawing>
+    <wp:anchor distT="0" distB="0" distL="0" distR="0" simplePos="0" relativeHeight="{id}"
+               behindDoc="0" locked="0" layoutInCell="1" allowOverlap="1">
+      <wp:simplePos x="0" y="0"/>
+      <wp:positionH relativeFrom="column"><wp:posOffset>0</wp:posOffset></wp:positionH>
+      <wp:positionV relativeFrom="paragraph"><wp:posOffset>0</wp:posOffset></wp:positionV>
+      <wp:extent cx="1828800" cy="457200"/>
+      <wp:wrapNone/>
+      <wp:docPr id="{id}" name="Text Box {id}"/>
+      <a:graphic>
+        <a:graphicData uri="http://schemas.microsoft.com/office/word/2010/wordprocessingShape">
+          <wps:wsp>
+            <wps:spPr><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></wps:spPr>
+            <wps:txbx>
+              <w:txbxContent>
+                <w:p><w:r><w:t>Attn: {{{{</w:t></w:r><w:r><w:t>Attn</w:t></w:r><w:r><w:t>}}}}</w:t></w:r></w:p>
+                <w:p><w:r><w:t xml:space="preserve">{{{{ContractorName}}}} {{{{ContractorEmail}}}}</w:t></w:r></w:p>
+              </w:txbxContent>
+            </wps:txbx>
+            <wps:bodyPr/>
+          </wps:wsp>
+        </a:graphicData>
+      </a:graphic>
+    </wp:anchor>
+  </w:drawing>
+</w:r>
+'''
+
+def tiny_png():
+    """A 1x1 PNG, so inline shapes don't need an image library"""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff'))
+            + chunk(b'IEND', b''))
+
+def build_template(path, paragraphs, tables, inline_shapes, textboxes):
+    """Write a synthetic template exercising every placeholder location"""
+    import io
+    from docx import Document
+    from docx.shared import Inches
+    from lxml import etree
+
+    doc = Document()
+    for index in range(paragraphs):
+        paragraph = doc.add_paragraph(BOILERPLATE)
+        if index % 5 == 0:
+            # Split the placeholder across runs the way Word does
+            name = PLACEHOLDERS[index % len(PLACEHOLDERS)]
+            paragraph.add_run('{{')
+            paragraph.add_run(name).bold = True
+            paragraph.add_run('}} ' + BOILERPLATE)
+
+    for index in range(tables):
+        table = doc.add_table(rows=3, cols=3)
+        for row_index, row in enumerate(table.rows):
+            for col_index, cell in enumerate(row.cells):
+                name = PLACEHOLDERS[(index + row_index + col_index) % len(PLACEHOLDERS)]
+                cell.text = f'{{{{ {name} }}}}' if col_index == 0 else 'Terms and conditions apply.'
+
+    # A line-item table: header row, one prototype row repeated per item, total row
+    line_items = doc.add_table(rows=3, cols=4)
+    for cell, text in zip(line_items.rows[0].cells, ['Item', 'Qty', 'Unit Price', 'Total']):
+        cell.text = text
+    prototype = ['{{LineItems}}{{ItemName}}', '{{ItemQuantity}}', '{{ItemUnitPrice}}', '{{ItemTotal}}']
+    for cell, text in zip(line_items.rows[1].cells, prototype):
+        cell.text = text
+    line_items.rows[2].cells[0].text = 'Total {{TotalPrice}}'
+
+    image = tiny_png()
+    for _ in range(inline_shapes):
+        doc.add_paragraph().add_run().add_picture(io.BytesIO(image), width=Inches(0.5))
+
+    for index in range(textboxes):
+        paragraph = doc.add_paragraph()
+        paragraph._p.append(etree.fromstring(TEXTBOX_XML.format(id=1000 + index)))
+
+    doc.save(path)
+
+def make_project(item_count):
+    """A stand-in for a Project row with item_count Item rows"""
+    from types import SimpleNamespace
+    items = [SimpleNamespace(id=index, name=['Curbs', 'Pipes'][index % 2], quantity=index % 7 + 1, price=12.5)
+             for index in range(item_count)]
+    return SimpleNamespace(
+        id=1, name='Benchmark Job', date='2024-03-05', attn='Estimator', contractor_name='ACME Roofing',
+        contractor_email='bids@acme.example', job_contact='Jim', job_contact_phone='555-0100',
+        address='1 Main St, San Jose, CA, 95112, USA', items=items)
+
+def run_case(template_path, item_count, iterations, warmup):
+    """Render one template/project combination; runs in its own process"""
+    # Import the app against a throwaway database so proposal_values is the real one
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    import app as proposal_app
+    from proposal_template import ProposalTemplate
+
+    template = ProposalTemplate(template_path)
+    project = make_project(item_count)
+
+    def render():
+        return template.render(proposal_app.proposal_values(project))
+
+    for _ in range(warmup):
+        render()
+
+    timings = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        began = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - began)
+    elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(timings, n=100, method='inclusive')
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+    return {
+        'p50_ms': round(quantiles[49] * 1000, 3),
+        'p95_ms': round(quantiles[94] * 1000, 3),
+        'p99_ms': round(quantiles[98] * 1000, 3),
+        'throughput_per_s': round(iterations / elapsed, 2),
+        'peak_rss_mb': round(peak_rss / (1024 * 1024), 1),
+    }
+
+def _case_worker(queue, *args):
+    import contextlib
+    # Keep the app's startup chatter out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        queue.put(run_case(*args))
+
+def run_isolated(*args):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_case_worker, args=(queue, *args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def compare(results, baseline, tolerance):
+    """Return the cases whose p95 latency or throughput regressed beyond tolerance"""
+    previous = {(case['template'], case['items']): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = previous.get((case['template'], case['items']))
+        if old is None:
+            continue
+        if case['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{case['template']}/{case['items']} items: p95 {old['p95_ms']}ms -> {case['p95_ms']}ms")
+        if case['throughput_per_s'] < old['throughput_per_s'] * (1 - tolerance):
+            regressions.append(f"{case['template']}/{case['items']} items: throughput "
+                               f"{old['throughput_per_s']}/s -> {case['throughput_per_s']}/s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(TEMPLATE_SIZES), help='Template sizes to run')
+    parser.add_argument('--items', default=','.join(map(str, ITEM_COUNTS)), help='Item counts to run')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', help='Write the JSON results to this file as well as stdout')
+    parser.add_argument('--baseline', help='Compare against a stored baseline and fail on regressions')
+    parser.add_argument('--save-baseline', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed slowdown before failing (0.15 = 15%%)')
+    args = parser.parse_args()
+
+    sizes = [size for size in args.sizes.split(',') if size]
+    item_counts = [int(count) for count in args.items.split(',') if count]
+    results = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'iterations': args.iterations,
+        'cases': [],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            shape = TEMPLATE_SIZES[size]
+            template_path = os.path.join(directory, f'template_{size}.docx')
+            build_template(template_path, **shape)
+            for item_count in item_counts:
+                case = {'template': size, **shape, 'items': item_count,
+                        **run_isolated(template_path, item_count, args.iterations, args.warmup)}
+                results['cases'].append(case)
+                print(f"{size:>6} template, {item_count:>4} items: p50 {case['p50_ms']}ms "
+                      f"p95 {case['p95_ms']}ms p99 {case['p99_ms']}ms "
+                      f"{case['throughput_per_s']}/s rss {case['peak_rss_mb']}MB", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                f.write(output + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print('Performance regressions against baseline:', file=sys.stderr)
+            for regression in regressions:
+                print(f'  {regression}', file=sys.stderr)
+            sys.exit(1)
+        print('No regressions against baseline', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark bulk re-pricing of saved items after a price change.
+
+Creates a throwaway SQLite database with many projects holding items
+drawn from a price table, changes a share of the prices, diffs the two
+snapshots and times reprice_items over all projects and over unsent
+projects only. Prints the results as JSON.
+
+Usage (from the repository root):
+    python benchmarks/bench_repricing.py --items 100000
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000, help='Saved items across all projects')
+    parser.add_argument('--items-per-project', type=int, default=50)
+    parser.add_argument('--names', type=int, default=5000, help='Distinct item names in the price table')
+    parser.add_argument('--changed', type=float, default=0.2, help='Share of prices that change')
+    parser.add_argument('--sent', type=float, default=0.5, help='Share of projects whose proposal was sent')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    os.environ['PRICE_SNAPSHOT_PATH'] = os.path.join(directory, 'prices.db')
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as proposal_app
+    from datetime import datetime
+    from models import db, Item, Project
+    from price_cache import diff_prices
+    from repricing import reprice_items
+
+    generator = random.Random(1)
+    old_prices = {f'Item {index:05d}': round(generator.uniform(1, 5000), 2) for index in range(args.names)}
+    new_prices = dict(old_prices)
+    for name in generator.sample(sorted(old_prices), int(args.names * args.changed)):
+        new_prices[name] = round(new_prices[name] * 1.05, 2)
+    names = sorted(old_prices)
+
+    results = {'items': args.items, 'names': args.names, 'changed_share': args.changed, 'cases': {}}
+    with proposal_app.app.app_context():
+        project_count = max(1, args.items // args.items_per_project)
+        began = time.perf_counter()
+        db.session.execute(Project.__table__.insert(), [
+            {'id': index + 1, 'name': f'Project {index}',
+             'proposal_sent_at': datetime.utcnow() if generator.random() < args.sent else None}
+            for index in range(project_count)])
+        db.session.execute(Item.__table__.insert(), [
+            {'name': name, 'quantity': 1, 'price': old_prices[name], 'project_id': index % project_count + 1}
+            for index, name in enumerate(generator.choice(names) for _ in range(args.items))])
+        db.session.commit()
+        results['setup_seconds'] = round(time.perf_counter() - began, 2)
+
+        began = time.perf_counter()
+        diff = diff_prices(old_prices, new_prices)
+        results['cases']['diff'] = {'seconds': round(time.perf_counter() - began, 4), 'summary': diff.summary()}
+
+        for case, unsent_only in (('unsent_only', True), ('all_projects', False)):
+            began = time.perf_counter()
+            result = reprice_items(diff.changed, unsent_only=unsent_only)
+            db.session.commit()
+            results['cases'][case] = {'seconds': round(time.perf_counter() - began, 3),
+                                      'items_updated': result.items_updated,
+                                      'projects': len(result.project_ids)}
+
+    shutil.rmtree(directory, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark the cost of a price refresh with and without a reused Sheets client.
+
+Starts a local stand-in for the Google token and Sheets endpoints, then
+times refreshes the way get_sheet_data used to do them (new credentials,
+client and connections every time) against the long-lived client in
+sheets_helper. Prints per-refresh latency and how many TCP connections
+and token requests each approach needed.
+
+Usage (from the repository root):
+    python benchmarks/bench_sheets_client.py --refreshes 50 --rows 500
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_sheets_server import FakeGoogle, start_server, configure_environment
+
+def legacy_refresh():
+    """The refresh as it was done before the client was reused"""
+    import sheets_helper
+    from googleapiclient.discovery import build
+    service = build('sheets', 'v4', credentials=sheets_helper.get_credentials(),
+                    client_options={'api_endpoint': sheets_helper.API_ENDPOINT})
+    result = service.spreadsheets().values().get(spreadsheetId=sheets_helper.SPREADSHEET_ID,
+                                                  range=sheets_helper.RANGE_NAME).execute()
+    return sheets_helper.parse_price_rows(result.get('values', []))
+
+def measure(refresh, refreshes):
+    stats = FakeGoogle.stats
+    before = dict(stats)
+    timings = []
+    for _ in range(refreshes):
+        began = time.perf_counter()
+        prices = refresh()
+        timings.append(time.perf_counter() - began)
+        if not prices:
+            raise RuntimeError('Refresh returned no prices')
+    quantiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'first_ms': round(timings[0] * 1000, 2),
+        'p50_ms': round(quantiles[49] * 1000, 2),
+        'p95_ms': round(quantiles[94] * 1000, 2),
+        'connections': stats['connections'] - before['connections'],
+        'token_requests': stats['tokens'] - before['tokens'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--refreshes', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=500, help='Price rows returned by the fake sheet')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Simulated server latency per request')
+    args = parser.parse_args()
+
+    FakeGoogle.rows = [['Item', 'Price']] + [[f'Item {index}', f'${index}.50'] for index in range(args.rows)]
+    FakeGoogle.latency = args.latency_ms / 1000
+    server = start_server()
+    configure_environment(server.server_address[1])
+
+    import sheets_helper
+    results = {
+        'refreshes': args.refreshes,
+        'rows': args.rows,
+        'before': measure(legacy_refresh, args.refreshes),
+        'after': measure(sheets_helper.get_sheet_data, args.refreshes),
+    }
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark receiving concurrent image uploads.
+
+Builds a multipart request body on disk and has several threads parse it
+at once, the way several admins uploading images would, comparing:
+
+    buffered  default form parsing, then the whole file read into memory
+              to hash and write it
+    copied    default form parsing, a size check that seeks, a hashing pass
+              and a copy to the destination
+    streamed  parsing straight into UploadFile, which hashes, measures and
+              keeps the first bytes in the same pass, then moves the file
+              into place
+
+Reports wall time and the peak Python memory allocated across all threads
+(tracemalloc) for each mode, as JSON.
+
+Usage (from the repository root):
+    python benchmarks/bench_uploads.py --uploads 4 --size-mb 16
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.formparser import parse_form_data
+
+from uploads import UploadFile
+
+BOUNDARY = 'benchmark-boundary'
+
+def write_body(path, size):
+    """A multipart/form-data body with one file field of size random bytes"""
+    with open(path, 'wb') as f:
+        f.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="name"\r\n\r\nItem\r\n'.encode())
+        f.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="image.png"\r\n'
+                'Content-Type: image/png\r\n\r\n'.encode())
+        remaining = size
+        while remaining:
+            chunk = os.urandom(min(remaining, 1024 * 1024))
+            f.write(chunk)
+            remaining -= len(chunk)
+        f.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+
+def parse(body_path, stream_factory=None):
+    stream = open(body_path, 'rb')
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+        'CONTENT_LENGTH': str(os.path.getsize(body_path)),
+        'wsgi.input': stream,
+    }
+    try:
+        _, _, files = parse_form_data(environ, stream_factory=stream_factory)
+    finally:
+        stream.close()
+    return files['image']
+
+def receive_buffered(body_path, directory, index):
+    image = parse(body_path)
+    data = image.read()
+    digest = hashlib.sha256(data).hexdigest()
+    with open(os.path.join(directory, f'{index}-{digest[:8]}'), 'wb') as f:
+        f.write(data)
+    image.close()
+
+def receive_copied(body_path, directory, index):
+    image = parse(body_path)
+    image.stream.seek(0, os.SEEK_END)
+    image.stream.tell()
+    image.stream.seek(0)
+    image.stream.read(2048)
+    image.stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: image.stream.read(64 * 1024), b''):
+        digest.update(chunk)
+    image.stream.seek(0)
+    image.save(os.path.join(directory, f'{index}-{digest.hexdigest()[:8]}'))
+    image.close()
+
+def receive_streamed(body_path, directory, index):
+    factory = lambda *args, **kwargs: UploadFile(os.path.join(directory, 'incoming'))
+    image = parse(body_path, factory)
+    upload = image.stream
+    upload.size, upload.head  # Measured and kept while parsing
+    upload.keep_as(os.path.join(directory, f'{index}-{upload.sha256[:8]}'))
+    image.close()
+
+def run(receive, body_path, uploads):
+    directory = tempfile.mkdtemp()
+    threads = [threading.Thread(target=receive, args=(body_path, directory, index)) for index in range(uploads)]
+    tracemalloc.start()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    shutil.rmtree(directory, ignore_errors=True)
+    return {'seconds': round(elapsed, 3), 'peak_mb': round(peak / 1024 / 1024, 2)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=4, help='Concurrent uploads')
+    parser.add_argument('--size-mb', type=float, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    body_directory = tempfile.mkdtemp()
+    body_path = os.path.join(body_directory, 'body')
+    write_body(body_path, int(args.size_mb * 1024 * 1024))
+
+    results = {'uploads': args.uploads, 'size_mb': args.size_mb, 'modes': {}}
+    for mode, receive in (('buffered', receive_buffered), ('copied', receive_copied),
+                          ('streamed', receive_streamed)):
+        runs = [run(receive, body_path, args.uploads) for _ in range(args.repeat)]
+        results['modes'][mode] = {'seconds': min(r['seconds'] for r in runs),
+                                  'peak_mb': max(r['peak_mb'] for r in runs)}
+    shutil.rmtree(body_directory, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
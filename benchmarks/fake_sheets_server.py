@@ -0,0 +1,148 @@
+"""
+A local stand-in for the Google token and Sheets values endpoints.
+
+Used by the Sheets benchmarks, and runnable on its own to exercise the
+timeouts, retries and circuit breaker in sheets_helper against a server
+that can answer normally, slowly, with errors, hang or drop connections.
+
+Usage (from the repository root):
+    python benchmarks/fake_sheets_server.py
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class FakeGoogle(BaseHTTPRequestHandler):
+    """
+    Answers token requests and values.get calls, counting connections.
+
+    mode controls values.get: 'ok', 'slow' (waits latency seconds),
+    'error' (503), 'hang' (never answers in time), 'trickle' (sends the
+    response a byte every latency seconds) or 'drop' (closes the
+    connection without a response).
+    """
+    protocol_version = 'HTTP/1.1'  # Allow keep-alive
+    wbufsize = 64 * 1024  # Send headers and body together, avoiding delayed-ACK stalls
+    disable_nagle_algorithm = True
+    rows = [['Item', 'Price'], ['Curbs', '$12.50']]
+    stats = {'connections': 0, 'tokens': 0, 'requests': 0}
+    mode = 'ok'
+    latency = 0.0
+
+    def setup(self):
+        super().setup()
+        self.stats['connections'] += 1
+
+    def _reply(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.stats['tokens'] += 1
+        self._reply({'access_token': 'fake-token', 'expires_in': 3600, 'token_type': 'Bearer'})
+
+    def do_GET(self):
+        self.stats['requests'] += 1
+        if self.mode == 'drop':
+            self.close_connection = True
+            return
+        if self.mode == 'hang':
+            time.sleep(60)
+            return
+        if self.mode == 'trickle':
+            body = json.dumps({'range': 'Sheet1!A1:B', 'majorDimension': 'ROWS', 'values': self.rows}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.flush()
+            try:
+                for index in range(len(body)):
+                    self.wfile.write(body[index:index + 1])
+                    self.wfile.flush()
+                    time.sleep(self.latency)
+            except OSError:
+                pass  # The client gave up
+            return
+        if self.mode == 'error':
+            self._reply({'error': {'code': 503, 'message': 'Backend Error', 'status': 'UNAVAILABLE'}}, status=503)
+            return
+        time.sleep(self.latency)
+        self._reply({'range': 'Sheet1!A1:B', 'majorDimension': 'ROWS', 'values': self.rows})
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    """Serve FakeGoogle on a free local port in a background thread"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGoogle)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def configure_environment(port, **settings):
+    """Point the service-account settings at the local server with a throwaway key"""
+    import rsa
+    _, private_key = rsa.newkeys(2048)
+    os.environ.update({
+        'GOOGLE_PROJECT_ID': 'fake',
+        'GOOGLE_PRIVATE_KEY_ID': 'fake',
+        'GOOGLE_PRIVATE_KEY': private_key.save_pkcs1().decode('ascii'),
+        'GOOGLE_CLIENT_EMAIL': 'fake@fake.iam.gserviceaccount.com',
+        'GOOGLE_CLIENT_ID': '1',
+        'GOOGLE_TOKEN_URI': f'http://127.0.0.1:{port}/token',
+        'GOOGLE_SHEETS_API_ENDPOINT': f'http://127.0.0.1:{port}/',
+        **{name: str(value) for name, value in settings.items()},
+    })
+
+def main():
+    server = start_server()
+    configure_environment(server.server_address[1], SHEETS_CONNECT_TIMEOUT=1, SHEETS_READ_TIMEOUT=0.5,
+                          SHEETS_RETRIES=2, SHEETS_FETCH_BUDGET=5,
+                          SHEETS_BREAKER_FAILURES=2, SHEETS_BREAKER_COOLDOWN=2)
+    import sheets_helper
+    breaker = sheets_helper.breaker
+
+    failures = []
+
+    def scenario(name, mode, expect_prices, expect_state, max_seconds):
+        FakeGoogle.mode = mode
+        requests_before = FakeGoogle.stats['requests']
+        began = time.perf_counter()
+        prices = sheets_helper.get_sheet_data()
+        elapsed = time.perf_counter() - began
+        requests = FakeGoogle.stats['requests'] - requests_before
+        ok = bool(prices) == expect_prices and breaker.state == expect_state and elapsed <= max_seconds
+        print(f"{'PASS' if ok else 'FAIL'} {name}: {elapsed:.2f}s, {requests} requests, "
+              f"{len(prices)} prices, breaker {breaker.state}")
+        if not ok:
+            failures.append(name)
+
+    scenario('healthy', 'ok', True, 'closed', 2)
+    scenario('server errors are retried, then counted', 'error', False, 'closed', 5)
+    scenario('hanging reads time out', 'hang', False, 'open', 5)
+    scenario('open breaker fails fast', 'ok', False, 'open', 0.1)
+    time.sleep(breaker.cooldown)
+    scenario('trial call after cool-down fails', 'drop', False, 'open', 5)
+    time.sleep(breaker.cooldown)
+    scenario('trial call after cool-down recovers', 'ok', True, 'closed', 2)
+    FakeGoogle.latency = 0.2  # Each byte arrives well within the read timeout
+    scenario('trickled responses stop at the fetch budget', 'trickle', False, 'closed', 5.5)
+    FakeGoogle.latency = 0.0
+
+    server.shutdown()
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""
+Load-test the /changes server-sent event stream with many idle connections.
+
+Starts the app on a local port with a CSV price source, either on one
+gevent worker from gunicorn.conf.py, the production setup, or on the
+threaded development server, opens many concurrent streams with asyncio, changes one price in the CSV file and
+measures how long the change takes to reach every stream. Reports
+connect and fan-out latency and the server's RSS and thread count while
+the streams are held open, as JSON.
+
+Streams need a logged-in session: the benchmark creates a user and
+signs a session cookie for it. Pass --url and --cookie (the session
+cookie of a logged-in browser) to only open and hold streams against a
+server that is already running.
+
+Usage (from the repository root):
+    python benchmarks/load_change_feed.py --streams 2000
+    python benchmarks/load_change_feed.py --streams 200 --server threaded
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER = '''
+import sys
+from werkzeug.serving import make_server
+import app
+server = make_server('127.0.0.1', int(sys.argv[1]), app.app, threaded=True)
+server.socket.listen(4096)
+server.serve_forever()
+'''
+
+# Creates the benchmark user and prints a session cookie logging it in
+LOGIN = '''
+import app
+from models import db, User
+with app.app.app_context():
+    user = User(username='load-test', email='load-test@example.com')
+    user.set_password('load-test')
+    db.session.add(user)
+    db.session.commit()
+    print(app.app.session_interface.get_signing_serializer(app.app).dumps({'_user_id': str(user.id), '_fresh': True}))
+'''
+
+def write_prices(path, first_price):
+    with open(path, 'w') as f:
+        f.write('Item,Price\n')
+        f.write(f'Curbs,${first_price:.2f}\n')
+        for index in range(1000):
+            f.write(f'Item {index},${index}.50\n')
+
+def start_server(directory, port, server):
+    """Run the app with a CSV price source that refreshes every second; returns it, the CSV and a session cookie"""
+    prices = os.path.join(directory, 'prices.csv')
+    write_prices(prices, 10)
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(directory, 'app.db')}",
+               PRICE_SOURCE='csv', PRICE_SOURCE_PATH=prices,
+               PRICE_SNAPSHOT_PATH=os.path.join(directory, 'snapshot.db'),
+               PRICE_CACHE_SECONDS='1', CHANGE_FEED='True', CHANGE_FEED_MAX_STREAMS='100000',
+               CHANGE_FEED_MAX_USER_STREAMS='100000', FLASK_SECRET_KEY='load-test')
+    session = subprocess.run([sys.executable, '-c', LOGIN], cwd=ROOT, env=env, capture_output=True, text=True,
+                             check=True).stdout.split()[-1]
+    cookie = f'session={session}'
+    if server == 'gevent':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', '1',
+                   '--bind', f'127.0.0.1:{port}', '--backlog', '4096', 'app:app']
+    else:
+        command = [sys.executable, '-c', SERVER, str(port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            ready = urllib.request.Request(f'http://127.0.0.1:{port}/get_prices', headers={'Cookie': cookie})
+            with urllib.request.urlopen(ready) as response:
+                if json.load(response)['version'] > 0:
+                    return process, prices, cookie
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('The server did not start')
+
+def server_usage(pid):
+    """RSS in MB and thread count of a Linux process, or of its worker if it is a gunicorn master"""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pid = int(f.read().split()[0])
+    except (OSError, IndexError):
+        pass
+    usage = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                usage['rss_mb'] = round(int(line.split()[1]) / 1024, 1)
+            elif line.startswith('Threads:'):
+                usage['threads'] = int(line.split()[1])
+    return usage
+
+class Stream:
+    """One open /changes connection"""
+
+    def __init__(self):
+        self.buffer = b''
+        self.reader = None
+        self.writer = None
+
+    async def open(self, host, port, path, cookie):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n'
+                          f'Cookie: {cookie}\r\n\r\n'.encode())
+        await self.writer.drain()
+        await self.read_until(b'event: hello')
+
+    async def read_until(self, marker):
+        while marker not in self.buffer:
+            data = await self.reader.read(65536)
+            if not data:
+                raise ConnectionError('Stream closed')
+            self.buffer += data
+        self.buffer = self.buffer[self.buffer.index(marker) + len(marker):]
+
+    def close(self):
+        self.writer.close()
+
+def quantiles(values):
+    values = sorted(values)
+    cut = statistics.quantiles(values, n=100, method='inclusive') if len(values) > 1 else values * 99
+    return {'p50_ms': round(cut[49] * 1000, 1), 'p99_ms': round(cut[98] * 1000, 1),
+            'max_ms': round(values[-1] * 1000, 1)}
+
+async def run(args, host, port, path, cookie, prices_path, pid):
+    streams = [Stream() for _ in range(args.streams)]
+    limit = asyncio.Semaphore(args.connect_concurrency)
+    connect_times = []
+
+    async def connect(stream):
+        async with limit:
+            began = time.perf_counter()
+            await stream.open(host, port, path, cookie)
+            connect_times.append(time.perf_counter() - began)
+
+    began = time.perf_counter()
+    await asyncio.gather(*(connect(stream) for stream in streams))
+    results = {'streams': args.streams, 'connect_seconds': round(time.perf_counter() - began, 2),
+               'connect': quantiles(connect_times)}
+
+    await asyncio.sleep(args.hold)
+    if pid:
+        results['server_while_idle'] = server_usage(pid)
+
+    if prices_path:
+        delivery = []
+
+        async def receive(stream, changed_at):
+            await stream.read_until(b'event: prices')
+            delivery.append(time.perf_counter() - changed_at)
+
+        changed_at = time.perf_counter()
+        write_prices(prices_path, 12)
+        await asyncio.wait_for(asyncio.gather(*(receive(stream, changed_at) for stream in streams)), 60)
+        # Includes up to a second of waiting for the next refresh of the CSV file
+        results['price_change_delivery'] = quantiles(delivery)
+
+    for stream in streams:
+        stream.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=1000)
+    parser.add_argument('--hold', type=float, default=5, help='Seconds to hold the idle streams open')
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help='Stream from this running server instead of starting one')
+    parser.add_argument('--cookie', help='Session cookie for --url, e.g. session=...')
+    parser.add_argument('--server', choices=['gevent', 'threaded'], default='gevent',
+                        help='gunicorn with one gevent worker, or the threaded development server')
+    args = parser.parse_args()
+
+    if args.url and not args.cookie:
+        parser.error('--url needs the --cookie of a logged-in session')
+    if args.url:
+        parts = urlsplit(args.url)
+        results = asyncio.run(run(args, parts.hostname, parts.port or 80, parts.path or '/changes', args.cookie,
+                                  None, None))
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            process, prices_path, cookie = start_server(directory, args.port, args.server)
+            try:
+                results = {'server': args.server,
+                           **asyncio.run(run(args, '127.0.0.1', args.port, '/changes', cookie, prices_path,
+                                             process.pid))}
+            finally:
+                process.terminate()
+                process.wait()
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+import hashlib
+import json
+import threading
+import time
+from types import MappingProxyType
+from flask import has_app_context
+from sqlalchemy.exc import SQLAlchemyError
+from metrics import registry
+from models import db, CatalogItem, CatalogState
+from item_images import image_variants
+from catalog_search import SearchIndex
+
+catalog_version = registry.gauge('catalog_version', 'Catalog version served by this process')
+catalog_syncs = registry.counter('catalog_syncs_total', 'Catalog syncs that picked up changes', ['kind'])
+
+class CatalogConflictError(Exception):
+    """Raised when a catalog entry with the name already exists"""
+    pass
+
+class CatalogEntry:
+    """One item offered on project pages"""
+    __slots__ = ('id', 'name', 'image_path')
+
+    def __init__(self, id, name, image_path=None):
+        self.id = id
+        self.name = name
+        self.image_path = image_path
+
+    def as_dict(self):
+        """The entry as sent to pages, with its thumbnail and preview image paths"""
+        return {'name': self.name, 'image_path': self.image_path, **image_variants(self.image_path)}
+
+class CatalogSnapshot:
+    """
+    An immutable version of the catalog with its read views built once.
+
+    entries maps names to entries, sorted lists them by name for the
+    project and admin pages, and items_json is the serialized
+    /get_items_info response, with an ETag that is a digest of those bytes.
+    search is the SearchIndex of entry names; a snapshot made from another
+    passes it in, updated for the names that changed.
+    """
+    __slots__ = ('version', 'entries', 'sorted', 'items_json', 'etag', 'search')
+
+    def __init__(self, version, entries, search=None):
+        self.version = version
+        self.sorted = tuple(sorted(entries, key=lambda entry: entry.name))
+        self.entries = MappingProxyType({entry.name: entry for entry in self.sorted})
+        items = [entry.as_dict() for entry in self.sorted]
+        self.items_json = json.dumps({'success': True, 'items': items}, separators=(',', ':')).encode('utf-8')
+        self.etag = hashlib.sha256(self.items_json).hexdigest()[:32]
+        self.search = search if search is not None else SearchIndex(self.entries)
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def with_rows(self, version, rows):
+        """
+        A new snapshot at version with changed catalog rows applied.
+
+        rows are (id, name, image_path, deleted) tuples. Entries are matched
+        by id, so renames replace the old name, and a changed row takes its
+        name over from any other entry still holding it.
+        """
+        by_id = {entry.id: entry for entry in self.sorted}
+        names = {}
+        old_names = set()
+        for id, name, image_path, deleted in rows:
+            previous = by_id.pop(id, None)
+            if previous is not None:
+                old_names.add(previous.name)
+            if not deleted:
+                by_id[id] = CatalogEntry(id, name, image_path)
+                names[name] = id
+        entries = [entry for entry in by_id.values() if names.get(entry.name, entry.id) == entry.id]
+        # Only names are indexed, so image changes and names passed between entries leave it alone
+        old_names.update(name for name in names if name in self.entries)
+        search = self.search.updated([entry.name for entry in entries],
+                                     [name for name in names if name not in old_names],
+                                     [name for name in old_names if name not in names])
+        return CatalogSnapshot(version, entries, search)
+
+EMPTY_CATALOG = CatalogSnapshot(0, ())
+
+def diff_catalogs(old, new):
+    """Entries of new that were added or edited since old, and names old had that new doesn't"""
+    changed = []
+    for entry in new.sorted:
+        previous = old.entries.get(entry.name)
+        if previous is None or previous.id != entry.id or previous.image_path != entry.image_path:
+            changed.append(entry)
+    return changed, [name for name in old.entries if name not in new.entries]
+
+def read_items_file(path):
+    """(name, image_path) pairs from the pipe-delimited items file, or [] if it doesn't exist"""
+    try:
+        with open(path, 'r') as f:
+            rows = []
+            for line in f:
+                if line.strip():
+                    parts = line.strip().split('|')
+                    rows.append((parts[0], parts[1] if len(parts) > 1 and parts[1] else None))
+            return rows
+    except FileNotFoundError:
+        return []
+
+class Catalog:
+    """
+    The item catalog, stored in the catalog_item table.
+
+    Readers take the current CatalogSnapshot, a single attribute read, and
+    never lock. Every change bumps the version in catalog_state and stamps
+    the changed row with it; deletions are kept as flagged rows. At most
+    once every sync_interval seconds a reader compares the stored version
+    with the snapshot's, one integer read, and when it has moved only the
+    rows changed since are fetched and applied to a new snapshot, which is
+    swapped in. Writes sync the same way once they commit, so every worker
+    process serves the same catalog within sync_interval of a change.
+
+    Callbacks added with subscribe are called with the new snapshot, the
+    added or edited entries and the removed names whenever the snapshot
+    changes, whichever process made the change.
+    """
+
+    def __init__(self, sync_interval=1):
+        self.sync_interval = sync_interval
+        self._snapshot = EMPTY_CATALOG
+        self._next_sync = 0
+        self._write_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._subscribers = []
+        self._watching = False
+
+    @property
+    def snapshot(self):
+        """The current snapshot, picking up changes from other processes every sync_interval"""
+        now = time.time()
+        if now >= self._next_sync and has_app_context():
+            self._sync(now)
+        return self._snapshot
+
+    def __contains__(self, name):
+        return name in self.snapshot
+
+    def get(self, name):
+        return self.snapshot.get(name)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def watch(self, app):
+        """Keep syncing in a background thread even when no request reads the catalog"""
+        with self._sync_lock:
+            if self._watching:
+                return
+            self._watching = True
+
+        def run():
+            while True:
+                with app.app_context():
+                    self.snapshot
+                time.sleep(self.sync_interval)
+
+        threading.Thread(target=run, name='catalog-watch', daemon=True).start()
+
+    def load(self):
+        """Read the whole catalog into a new snapshot"""
+        with self._sync_lock:
+            with db.engine.connect() as connection:
+                version = self._stored_version(connection)
+                rows = connection.execute(
+                    db.select(CatalogItem.id, CatalogItem.name, CatalogItem.image_path, CatalogItem.version)
+                    .where(CatalogItem.deleted.is_(False))).all()
+            version = max([version] + [row.version for row in rows])
+            self._swap(CatalogSnapshot(version, [CatalogEntry(id, name, image_path)
+                                                 for id, name, image_path, _ in rows]), 'full')
+            self._next_sync = time.time() + self.sync_interval
+        return self._snapshot
+
+    def import_file(self, path):
+        """Add the items of a pipe-delimited items file that aren't in the catalog yet"""
+        with self._write_lock:
+            snapshot = self._snapshot
+            rows = {name: image_path for name, image_path in read_items_file(path) if name not in snapshot}
+            if rows:
+                version = self._next_version()
+                db.session.execute(CatalogItem.__table__.insert(), [
+                    {'name': name, 'image_path': image_path, 'version': version, 'deleted': False}
+                    for name, image_path in rows.items()])
+                db.session.commit()
+        self._sync(time.time(), wait=True)
+        return len(rows)
+
+    def add(self, name, image_path=None):
+        with self._write_lock:
+            row = db.session.execute(db.select(CatalogItem).where(CatalogItem.name == name)).scalar_one_or_none()
+            if row is None:
+                row = CatalogItem(name=name)
+                db.session.add(row)
+            elif not row.deleted:
+                raise CatalogConflictError(f'{name} is already in the catalog')
+            row.image_path = image_path
+            row.deleted = False
+            row.version = self._next_version()
+            db.session.commit()
+            entry = CatalogEntry(row.id, name, image_path)
+        self._sync(time.time(), wait=True)
+        return entry
+
+    def update(self, old_name, new_name, image_path):
+        """Rename an entry and/or change its image; returns the new entry"""
+        with self._write_lock:
+            entry = self.snapshot.entries[old_name]
+            row = db.session.get(CatalogItem, entry.id)
+            if row is None or row.deleted:
+                raise KeyError(old_name)
+            if new_name != old_name:
+                holder = db.session.execute(
+                    db.select(CatalogItem).where(CatalogItem.name == new_name)).scalar_one_or_none()
+                if holder is not None and not holder.deleted:
+                    raise CatalogConflictError(f'{new_name} is already in the catalog')
+                if holder is not None:
+                    # Reuse the name of a deleted entry; the renamed row now claims it
+                    db.session.delete(holder)
+                    db.session.flush()
+            row.name = new_name
+            row.image_path = image_path
+            row.version = self._next_version()
+            db.session.commit()
+            updated = CatalogEntry(row.id, new_name, image_path)
+        self._sync(time.time(), wait=True)
+        return updated
+
+    def remove(self, name):
+        with self._write_lock:
+            entry = self.snapshot.entries[name]
+            db.session.execute(db.update(CatalogItem).where(CatalogItem.id == entry.id)
+                               .values(deleted=True, version=self._next_version()))
+            db.session.commit()
+        self._sync(time.time(), wait=True)
+
+    def _next_version(self):
+        """Claim the next catalog version inside the caller's transaction"""
+        bumped = db.session.execute(db.update(CatalogState).where(CatalogState.id == 1)
+                                    .values(version=CatalogState.version + 1))
+        if not bumped.rowcount:
+            db.session.add(CatalogState(id=1, version=1))
+            db.session.flush()
+        return db.session.execute(db.select(CatalogState.version).where(CatalogState.id == 1)).scalar()
+
+    @staticmethod
+    def _stored_version(connection):
+        return connection.execute(db.select(CatalogState.version).where(CatalogState.id == 1)).scalar() or 0
+
+    def _sync(self, now, wait=False):
+        """Apply the rows changed since the snapshot's version, if the stored version has moved"""
+        if not self._sync_lock.acquire(blocking=wait):
+            return  # Another thread is syncing; keep serving the current snapshot
+        try:
+            self._next_sync = now + self.sync_interval
+            current = self._snapshot
+            try:
+                with db.engine.connect() as connection:
+                    version = self._stored_version(connection)
+                    if version <= current.version:
+                        return
+                    rows = connection.execute(
+                        db.select(CatalogItem.id, CatalogItem.name, CatalogItem.image_path,
+                                  CatalogItem.deleted, CatalogItem.version)
+                        .where(CatalogItem.version > current.version)).all()
+            except SQLAlchemyError as e:
+                print(f"Error syncing catalog: {str(e)}")
+                return
+            version = max([version] + [row.version for row in rows])
+            self._swap(current.with_rows(version, [row[:4] for row in rows]), 'incremental')
+        finally:
+            self._sync_lock.release()
+
+    def _swap(self, snapshot, kind):
+        """Serve snapshot from now on and tell subscribers what changed; caller holds the sync lock"""
+        previous = self._snapshot
+        self._snapshot = snapshot
+        catalog_version.set(snapshot.version)
+        catalog_syncs.inc(kind=kind)
+        if not self._subscribers or previous is EMPTY_CATALOG:
+            return
+        changed, removed = diff_catalogs(previous, snapshot)
+        if not changed and not removed:
+            return
+        for callback in self._subscribers:
+            try:
+                callback(snapshot, changed, removed)
+            except Exception as e:
+                print(f"Error notifying catalog subscriber: {str(e)}")
@@ -0,0 +1,150 @@
+import re
+from array import array
+from bisect import bisect_left
+import numpy as np
+
+# Index keys are a normalized term, this separator and the entry's name; it sorts
+# before every term character, so exact terms come before longer completions
+SEPARATOR = '\x00'
+END = '\U0010ffff'
+
+# Above this many changed entries a new index is sorted from scratch rather than
+# patched, as every insert or delete shifts the rest of the key list
+PATCH_LIMIT = 100
+
+WORD = re.compile(r'\w+')
+
+def normalize(text):
+    """Case-folded text with runs of whitespace collapsed, as names are matched"""
+    return ' '.join(text.casefold().split())
+
+def tokenize(text):
+    """The distinct words of text, case-folded, in order"""
+    return list(dict.fromkeys(WORD.findall(text.casefold())))
+
+def _name_key(name):
+    return f'{normalize(name)}{SEPARATOR}{name}'
+
+def _token_keys(name):
+    return [f'{token}{SEPARATOR}{name}' for token in tokenize(name)]
+
+def _range(keys, prefix):
+    return bisect_left(keys, prefix), bisect_left(keys, prefix + END)
+
+def _find(keys, key):
+    position = bisect_left(keys, key)
+    return position if position < len(keys) and keys[position] == key else None
+
+class SearchIndex:
+    """
+    Prefix index over catalog entry names.
+
+    Two sorted key lists are searched with bisect: one of whole names, for
+    names starting with the query, and one of every word of every name, for
+    names with words starting with each word of the query. Each word key
+    has the number of its name alongside, in an int array, so the matches
+    of several query words are intersected with numpy instead of by
+    re-reading names. A lookup costs a few binary searches and a scan that
+    stops once it has enough matches.
+
+    An index is never changed once built; updated returns a new one with
+    entries added and removed, without tokenizing or sorting the rest again.
+    """
+    __slots__ = ('_names', '_tokens', '_owners', '_entries')
+
+    def __init__(self, names=()):
+        # Names are numbered by position in _entries; removed names leave a None
+        self._entries = list(names)
+        self._names = sorted(_name_key(name) for name in self._entries)
+        keys = []
+        owners = []
+        for number, name in enumerate(self._entries):
+            for key in _token_keys(name):
+                keys.append(key)
+                owners.append(number)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._tokens = [keys[position] for position in order]
+        self._owners = array('i', (owners[position] for position in order))
+
+    def __len__(self):
+        return len(self._names)
+
+    def updated(self, names, added, removed):
+        """
+        A new index with added names indexed and removed names dropped.
+
+        names are every name of the new catalog, used when there are too many
+        changes for patching the key lists to beat sorting them again.
+        """
+        if len(added) + len(removed) > PATCH_LIMIT:
+            return SearchIndex(names)
+        index = SearchIndex()
+        index._entries = list(self._entries)
+        index._names = list(self._names)
+        index._tokens = list(self._tokens)
+        index._owners = array('i', self._owners)
+        for name in removed:
+            position = _find(index._names, _name_key(name))
+            if position is not None:
+                del index._names[position]
+            for key in _token_keys(name):
+                position = _find(index._tokens, key)
+                if position is not None:
+                    index._entries[index._owners[position]] = None
+                    del index._tokens[position]
+                    del index._owners[position]
+        for name in added:
+            number = len(index._entries)
+            index._entries.append(name)
+            index._names.insert(bisect_left(index._names, _name_key(name)), _name_key(name))
+            for key in _token_keys(name):
+                position = bisect_left(index._tokens, key)
+                index._tokens.insert(position, key)
+                index._owners.insert(position, number)
+        return index
+
+    def search(self, query, limit=10):
+        """
+        Names matching query, best first, at most limit of them.
+
+        Names starting with the query come first, then names where every
+        word of the query starts a word of the name; each group is ordered
+        by the matched text, so the shortest completions lead.
+        """
+        terms = tokenize(query)
+        if not terms or limit <= 0:
+            return []
+        matches = []
+        seen = set()
+
+        start, end = _range(self._names, normalize(query))
+        for key in self._names[start:min(end, start + limit)]:
+            name = key.partition(SEPARATOR)[2]
+            matches.append(name)
+            seen.add(name)
+        if len(matches) == limit:
+            return matches
+
+        # Walk the matches of the rarest term, keeping names that match every other term
+        ranges = sorted((_range(self._tokens, term) for term in terms), key=lambda found: found[1] - found[0])
+        start, end = ranges[0]
+        if len(ranges) == 1:
+            candidates = self._owners[start:end]
+        else:
+            owners = np.frombuffer(self._owners, dtype=np.int32)
+            candidates = owners[start:end]
+            for start, end in ranges[1:]:
+                matched = np.zeros(len(self._entries), dtype=bool)
+                matched[owners[start:end]] = True
+                candidates = candidates[matched[candidates]]
+                if not len(candidates):
+                    break
+        for number in candidates:
+            name = self._entries[number]
+            if name in seen:
+                continue
+            matches.append(name)
+            seen.add(name)
+            if len(matches) == limit:
+                break
+        return matches
@@ -0,0 +1,103 @@
+import itertools
+import json
+import os
+import secrets
+import threading
+from collections import deque
+from metrics import registry
+
+feed_streams = registry.gauge('change_feed_streams', 'Open server-sent event streams')
+feed_events = registry.counter('change_feed_events_total', 'Events published to the change feed', ['event'])
+
+class FeedFullError(Exception):
+    """Raised when the change feed already has its maximum number of streams"""
+    pass
+
+class ChangeFeed:
+    """
+    Recent change events fanned out to any number of waiting readers.
+
+    Events are kept in a fixed-size ring buffer with increasing ids, and
+    readers sleep on a single condition variable until an event newer than
+    the last one they saw arrives, so an idle stream costs one blocked wait.
+    A reader too far behind the ring gets a reset event instead.
+
+    Ids count up per process, so the ids sent to browsers carry an epoch
+    naming the process; a browser reconnecting to another worker with its
+    Last-Event-ID is recognized as foreign rather than resumed from an
+    unrelated event.
+    """
+
+    def __init__(self, size=256, max_streams=5000, max_user_streams=10):
+        self.max_streams = max_streams
+        self.max_user_streams = max_user_streams
+        self._events = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._streams = 0
+        self._user_streams = {}
+        self._condition = threading.Condition()
+        self._new_epoch()
+        # Workers forked from a preloaded app would otherwise share one epoch
+        os.register_at_fork(after_in_child=self._new_epoch)
+
+    def _new_epoch(self):
+        self.epoch = secrets.token_hex(4)
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def event_id(self, number):
+        """The id sent to browsers for event number"""
+        return f'{self.epoch}-{number}'
+
+    def resume_after(self, last_event_id):
+        """The event number a browser's Last-Event-ID resumes after, None if it came from another process"""
+        epoch, _, number = last_event_id.partition('-')
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def publish(self, event, data):
+        """Add an event; data is serialized once and shared by every stream"""
+        payload = json.dumps(data, separators=(',', ':'))
+        with self._condition:
+            self._last_id = next(self._ids)
+            self._events.append((self._last_id, event, payload))
+            self._condition.notify_all()
+        feed_events.inc(event=event)
+
+    def wait(self, after_id, timeout):
+        """Return the (id, event, data) tuples newer than after_id, waiting up to timeout for one"""
+        with self._condition:
+            if after_id <= self._last_id:
+                self._condition.wait_for(lambda: self._last_id > after_id, timeout)
+                if self._last_id == after_id:
+                    return []
+            if after_id > self._last_id or self._events[0][0] > after_id + 1:
+                # Missed events, or ids from before a fork; the reader reloads everything
+                return [(self._last_id, 'reset', '{}')]
+            return [entry for entry in self._events if entry[0] > after_id]
+
+    def open_stream(self, user_id):
+        with self._condition:
+            if self._streams >= self.max_streams:
+                raise FeedFullError('Too many open change streams')
+            if self._user_streams.get(user_id, 0) >= self.max_user_streams:
+                raise FeedFullError('Too many open change streams for this user')
+            self._streams += 1
+            self._user_streams[user_id] = self._user_streams.get(user_id, 0) + 1
+        feed_streams.inc()
+
+    def close_stream(self, user_id):
+        with self._condition:
+            self._streams -= 1
+            self._user_streams[user_id] -= 1
+            if not self._user_streams[user_id]:
+                del self._user_streams[user_id]
+        feed_streams.dec()
+
+def format_event(event_id, event, data):
+    """Format one server-sent event"""
+    return f'id: {event_id}\nevent: {event}\ndata: {data}\n\n'
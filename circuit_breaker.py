@@ -0,0 +1,85 @@
+import threading
+import time
+from metrics import registry
+
+# Numeric breaker states as exported in the circuit_breaker_state gauge
+STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+breaker_state = registry.gauge('circuit_breaker_state', 'Breaker state: 0 closed, 1 half-open, 2 open', ['breaker'])
+breaker_opened = registry.counter('circuit_breaker_opened_total', 'Times a breaker opened', ['breaker'])
+breaker_calls = registry.counter('circuit_breaker_calls_total', 'Calls through a breaker by outcome', ['breaker', 'outcome'])
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its breaker is open"""
+    pass
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a cool-down period.
+
+    After failure_threshold consecutive failures the breaker opens and
+    calls fail fast with CircuitOpenError. Once cooldown seconds have
+    passed one trial call is let through (half-open); its success closes
+    the breaker and its failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=3, cooldown=120):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        breaker_state.set(STATES['closed'], breaker=name)
+
+    def _set_state(self, state):
+        """Caller holds the lock"""
+        if state == 'open' and self.state != 'open':
+            breaker_opened.inc(breaker=self.name)
+            print(f"Circuit breaker {self.name} opened after {self.failures} failures")
+        elif state == 'closed' and self.state != 'closed':
+            print(f"Circuit breaker {self.name} closed")
+        self.state = state
+        breaker_state.set(STATES[state], breaker=self.name)
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    breaker_calls.inc(breaker=self.name, outcome='rejected')
+                    raise CircuitOpenError(f'{self.name} is unavailable, retrying after the cool-down')
+                self._set_state('half_open')
+            if self.state == 'half_open':
+                if self._trial_running:
+                    breaker_calls.inc(breaker=self.name, outcome='rejected')
+                    raise CircuitOpenError(f'{self.name} is being retried')
+                self._trial_running = True
+
+    def call(self, function, *args, **kwargs):
+        """Call function through the breaker, re-raising its exceptions"""
+        self._before_call()
+        try:
+            result = function(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def record_success(self):
+        breaker_calls.inc(breaker=self.name, outcome='success')
+        with self._lock:
+            self._trial_running = False
+            self.failures = 0
+            self._set_state('closed')
+
+    def record_failure(self):
+        breaker_calls.inc(breaker=self.name, outcome='failure')
+        with self._lock:
+            self._trial_running = False
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state('open')
@@ -0,0 +1,22 @@
+"""
+Gunicorn settings for serving the app:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+With CHANGE_FEED=True every open project page holds a /changes stream for
+up to ten minutes. On sync workers each stream would take a whole worker,
+so the workers become gevent workers instead: a stream is then one
+greenlet sleeping on the feed, and one worker process holds up to
+CHANGE_FEED_MAX_STREAMS of them next to its ordinary requests. Without
+the feed the app runs on plain sync workers.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+
+if os.getenv('CHANGE_FEED', 'False').lower() == 'true':
+    worker_class = 'gevent'
+    # Room for every stream plus the page, price and proposal requests beside them
+    worker_connections = int(os.getenv('CHANGE_FEED_MAX_STREAMS', '100')) + 200
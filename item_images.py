@@ -0,0 +1,123 @@
+import io
+import os
+import re
+import tempfile
+from PIL import Image, ImageOps
+from validation import ValidationError
+
+# Where item image URLs point; the files live in the app's UPLOAD_FOLDER
+URL_PREFIX = '/static/item_images'
+
+# Longest side in pixels of the WebP variants made at ingest: a thumbnail for the
+# item picker and answer lists, and a preview for the questions modal
+THUMBNAIL_SIZE = 96
+PREVIEW_SIZE = 480
+VARIANT_SIZES = (PREVIEW_SIZE, THUMBNAIL_SIZE)
+WEBP_QUALITY = 80
+
+# Originals are named by a digest of their content, variants add their size
+DIGEST_LENGTH = 20
+HASHED_NAME = re.compile(r'^([0-9a-f]{%d})(?:-(\d+)\.webp|\.[a-z]+)$' % DIGEST_LENGTH)
+
+# Content-hashed files never change, so browsers may keep them for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+def image_filename(image_path):
+    """The file name of a stored image path; older paths may use backslashes"""
+    return os.path.basename(image_path.replace('\\', '/'))
+
+def is_hashed(filename):
+    return bool(HASHED_NAME.match(filename))
+
+def image_digest(image_path):
+    """The content digest of a stored original, or None for images stored before hashing"""
+    match = HASHED_NAME.match(image_filename(image_path))
+    return match.group(1) if match and not match.group(2) else None
+
+def image_variants(image_path):
+    """URLs of an image's thumbnail and preview; images stored before variants existed use the original"""
+    if not image_path:
+        return {'thumbnail_path': None, 'preview_path': None}
+    match = HASHED_NAME.match(image_filename(image_path))
+    if not match or match.group(2):
+        return {'thumbnail_path': image_path, 'preview_path': image_path}
+    digest = match.group(1)
+    return {'thumbnail_path': f'{URL_PREFIX}/{digest}-{THUMBNAIL_SIZE}.webp',
+            'preview_path': f'{URL_PREFIX}/{digest}-{PREVIEW_SIZE}.webp'}
+
+def _write_atomic(path, data):
+    """Write data to path through a temporary file, so readers never see a partial image"""
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temporary, 0o644)  # mkstemp files are private; the web server must read these
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+def render_variants(path):
+    """
+    Decode an image file once and encode its WebP variants, largest first.
+
+    Each variant is scaled down from the previous one, which is much cheaper
+    than scaling every size from the original. Returns {size: bytes}.
+    """
+    try:
+        with Image.open(path) as image:
+            image.draft('RGB', (PREVIEW_SIZE, PREVIEW_SIZE))  # JPEGs decode at a reduced scale
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                transparent = 'A' in image.mode or 'transparency' in image.info
+                image = image.convert('RGBA' if transparent else 'RGB')
+            variants = {}
+            for size in VARIANT_SIZES:
+                image.thumbnail((size, size), Image.LANCZOS)
+                output = io.BytesIO()
+                image.save(output, 'WEBP', quality=WEBP_QUALITY, method=4)
+                variants[size] = output.getvalue()
+            return variants
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError("Image could not be read; upload a PNG, JPEG or GIF file")
+
+def store_item_image(upload, extension, folder):
+    """
+    Store an UploadFile under its content hash with its WebP variants.
+
+    The digest was computed while the upload was received, and the upload
+    itself is moved into place as the original. An image that was uploaded
+    before is already on disk and is not processed again. Returns the image
+    path to save on the catalog entry.
+    """
+    digest = upload.sha256[:DIGEST_LENGTH]
+    extension = 'jpg' if extension.lower() == 'jpeg' else extension.lower()
+    filename = f'{digest}.{extension}'
+    targets = {size: os.path.join(folder, f'{digest}-{size}.webp') for size in VARIANT_SIZES}
+    original = os.path.join(folder, filename)
+    if not os.path.exists(original) or not all(os.path.exists(path) for path in targets.values()):
+        upload.flush()
+        variants = render_variants(upload.path)
+        for size, path in targets.items():
+            _write_atomic(path, variants[size])
+        # The original goes last; its presence marks the set as complete
+        upload.keep_as(original)
+    return f'{URL_PREFIX}/{filename}'
+
+def delete_item_image(image_path, folder, in_use=()):
+    """
+    Remove an image and its variants, keeping what the in_use image paths need.
+
+    Variants are named by digest alone, so the same bytes uploaded as a PNG
+    and as a JPEG share them; they stay while any image with that digest
+    is in use.
+    """
+    filename = image_filename(image_path)
+    kept = {image_filename(path) for path in in_use if path}
+    paths = [] if filename in kept else [os.path.join(folder, filename)]
+    digest = image_digest(filename)
+    if digest and digest not in {image_digest(name) for name in kept}:
+        paths += [os.path.join(folder, f'{digest}-{size}.webp') for size in VARIANT_SIZES]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
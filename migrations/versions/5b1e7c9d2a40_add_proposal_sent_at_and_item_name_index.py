@@ -0,0 +1,32 @@
+"""Add proposal_sent_at to Project and an index on Item.name
+
+Revision ID: 5b1e7c9d2a40
+Revises: c4fef3b85843
+Create Date: 2026-10-18 10:12:31.204118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e7c9d2a40'
+down_revision = 'c4fef3b85843'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('project', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('proposal_sent_at', sa.DateTime(), nullable=True))
+
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_item_name'), ['name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_item_name'))
+
+    with op.batch_alter_table('project', schema=None) as batch_op:
+        batch_op.drop_column('proposal_sent_at')
@@ -0,0 +1,70 @@
+"""Add the catalog_item table and import items.txt into it
+
+Revision ID: 8f3a6d2c1b57
+Revises: 5b1e7c9d2a40
+Create Date: 2026-10-18 14:05:12.480316
+
+"""
+import os
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3a6d2c1b57'
+down_revision = '5b1e7c9d2a40'
+branch_labels = None
+depends_on = None
+
+ITEMS_FILE = os.path.join(os.path.dirname(__file__), '..', '..', 'items.txt')
+
+
+def read_items():
+    """(name, image_path) pairs from the pipe-delimited items file"""
+    if not os.path.exists(ITEMS_FILE):
+        return []
+    rows = {}
+    with open(ITEMS_FILE, 'r') as f:
+        for line in f:
+            if line.strip():
+                parts = line.strip().split('|')
+                rows[parts[0]] = parts[1] if len(parts) > 1 and parts[1] else None
+    return list(rows.items())
+
+
+def upgrade():
+    bind = op.get_bind()
+    # The app's create_all may already have made the (empty or seeded) table
+    if not sa.inspect(bind).has_table('catalog_item'):
+        op.create_table('catalog_item',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('image_path', sa.String(length=200), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('catalog_item', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_catalog_item_name'), ['name'], unique=True)
+
+    catalog_item = sa.table('catalog_item',
+        sa.column('name', sa.String),
+        sa.column('image_path', sa.String),
+        sa.column('created_at', sa.DateTime),
+        sa.column('updated_at', sa.DateTime)
+    )
+    if bind.execute(sa.select(sa.func.count()).select_from(catalog_item)).scalar():
+        return
+    now = datetime.utcnow()
+    op.bulk_insert(catalog_item, [
+        {'name': name, 'image_path': image_path, 'created_at': now, 'updated_at': now}
+        for name, image_path in read_items()
+    ])
+
+
+def downgrade():
+    with op.batch_alter_table('catalog_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_catalog_item_name'))
+
+    op.drop_table('catalog_item')
@@ -0,0 +1,49 @@
+"""Add row versions and soft deletes to catalog_item, and the catalog_state version row
+
+Revision ID: d7e21f4a9c03
+Revises: 8f3a6d2c1b57
+Create Date: 2026-10-18 16:42:07.915532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e21f4a9c03'
+down_revision = '8f3a6d2c1b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = {column['name'] for column in sa.inspect(bind).get_columns('catalog_item')}
+    if 'version' not in columns:
+        with op.batch_alter_table('catalog_item', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+            batch_op.add_column(sa.Column('deleted', sa.Boolean(), nullable=False, server_default=sa.false()))
+            batch_op.create_index(batch_op.f('ix_catalog_item_version'), ['version'], unique=False)
+
+    # The app's create_all may already have made the table
+    if not sa.inspect(bind).has_table('catalog_state'):
+        op.create_table('catalog_state',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+    catalog_state = sa.table('catalog_state', sa.column('id', sa.Integer), sa.column('version', sa.Integer))
+    if not bind.execute(sa.select(sa.func.count()).select_from(catalog_state)).scalar():
+        op.bulk_insert(catalog_state, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    # Without the flag, deleted entries would come back
+    catalog_item = sa.table('catalog_item', sa.column('deleted', sa.Boolean))
+    op.execute(catalog_item.delete().where(catalog_item.c.deleted == sa.true()))
+    op.drop_table('catalog_state')
+
+    with op.batch_alter_table('catalog_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_catalog_item_version'))
+        batch_op.drop_column('deleted')
+        batch_op.drop_column('version')
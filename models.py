@@ -40,6 +40,8 @@ class Project(db.Model):
     job_contact_phone = db.Column(db.String(100))
     address = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set once the proposal has gone out, so later price changes leave it alone
+    proposal_sent_at = db.Column(db.DateTime, nullable=True)
     items = db.relationship('Item', backref='project', lazy=True, cascade='all, delete-orphan')
     # Add user relationship
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -47,8 +49,25 @@ class Project(db.Model):
 
 class Item(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
+
+# The item catalog offered on project pages; names are unique
+class CatalogItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True, index=True)
+    image_path = db.Column(db.String(200))
+    # Catalog version of the last change to this row; deleted rows are kept so
+    # other workers see the deletion when they catch up
+    version = db.Column(db.Integer, nullable=False, default=0, index=True)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# A single row holding the catalog version, bumped by every catalog change
+class CatalogState(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
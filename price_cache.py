@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from types import MappingProxyType
+from metrics import registry
+
+refresh_seconds = registry.histogram('price_refresh_seconds', 'Time spent loading prices from the price source')
+refresh_failures = registry.counter('price_refresh_failures_total', 'Price refreshes that failed or returned no prices')
+snapshot_version = registry.gauge('price_snapshot_version', 'Version of the price snapshot being served')
+snapshot_age = registry.gauge('price_snapshot_age_seconds', 'Seconds since the served price snapshot was loaded')
+price_changes = registry.counter('price_changes_total', 'Item names changed, added or removed by price refreshes', ['kind'])
+
+class PriceSnapshot:
+    """
+    An immutable set of prices produced by one refresh.
+
+    The whole table is serialized once, together with its version, so it
+    can be sent as is; the ETag is a digest of those bytes.
+    """
+    __slots__ = ('version', 'prices', 'loaded_at', 'table_json', 'etag')
+
+    def __init__(self, version, prices, loaded_at, prices_json=None):
+        self.version = version
+        self.prices = MappingProxyType(dict(prices))
+        self.loaded_at = loaded_at
+        if prices_json is None:
+            prices_json = json.dumps(prices, separators=(',', ':'))
+        self.table_json = f'{{"version":{version},"prices":{prices_json}}}'.encode('utf-8')
+        self.etag = hashlib.sha256(self.table_json).hexdigest()[:32]
+
+    def age(self):
+        return time.time() - self.loaded_at if self.loaded_at else None
+
+EMPTY_SNAPSHOT = PriceSnapshot(0, {}, 0)
+
+class PriceDiff:
+    """What one refresh changed: new prices of changed and added names, and removed names"""
+
+    def __init__(self, changed, added, removed):
+        self.changed = changed
+        self.added = added
+        self.removed = removed
+
+    def __bool__(self):
+        return bool(self.changed or self.added or self.removed)
+
+    def summary(self):
+        return f'{len(self.changed)} changed, {len(self.added)} added, {len(self.removed)} removed'
+
+def diff_prices(old, new):
+    """Compare two name-to-price mappings"""
+    old_names = old.keys()
+    new_names = new.keys()
+    changed = {name: new[name] for name in new_names & old_names if new[name] != old[name]}
+    added = {name: new[name] for name in new_names - old_names}
+    return PriceDiff(changed, added, sorted(old_names - new_names))
+
+class PriceStore:
+    """
+    The latest price snapshot persisted in a local SQLite file.
+
+    Every worker process on the host reads the same file, so they serve the
+    same prices and start warm after a restart. A lease row elects the one
+    process allowed to refresh from the price source at a time.
+    """
+
+    def __init__(self, path, lease_seconds=120):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.holder = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS price_snapshot ('
+                       'id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, '
+                       'loaded_at REAL NOT NULL, prices TEXT NOT NULL)')
+            db.execute('CREATE TABLE IF NOT EXISTS price_refresh_lease ('
+                       'id INTEGER PRIMARY KEY CHECK (id = 1), holder TEXT NOT NULL, expires_at REAL NOT NULL)')
+
+    @contextmanager
+    def _connection(self):
+        # Autocommit mode; writes open their own BEGIN IMMEDIATE transaction
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def version(self):
+        """Return (version, loaded_at) of the stored snapshot, (0, 0) if there is none"""
+        with self._connection() as db:
+            row = db.execute('SELECT version, loaded_at FROM price_snapshot WHERE id = 1').fetchone()
+        return row or (0, 0)
+
+    def load(self):
+        """Return the stored snapshot, or None if nothing was saved yet"""
+        with self._connection() as db:
+            row = db.execute('SELECT version, loaded_at, prices FROM price_snapshot WHERE id = 1').fetchone()
+        if row is None:
+            return None
+        version, loaded_at, prices = row
+        return PriceSnapshot(version, json.loads(prices), loaded_at, prices_json=prices)
+
+    def save(self, prices):
+        """Store prices as the next snapshot version and return it"""
+        loaded_at = time.time()
+        prices_json = json.dumps(prices, separators=(',', ':'))
+        with self._connection() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT version FROM price_snapshot WHERE id = 1').fetchone()
+                version = (row[0] if row else 0) + 1
+                db.execute('INSERT OR REPLACE INTO price_snapshot (id, version, loaded_at, prices) VALUES (1, ?, ?, ?)',
+                           (version, loaded_at, prices_json))
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        return PriceSnapshot(version, prices, loaded_at, prices_json=prices_json)
+
+    def acquire_lease(self):
+        """Try to become the refresher; True if this process now holds the lease"""
+        now = time.time()
+        with self._connection() as db:
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                row = db.execute('SELECT holder, expires_at FROM price_refresh_lease WHERE id = 1').fetchone()
+                if row is not None and row[0] != self.holder and row[1] > now:
+                    db.execute('ROLLBACK')
+                    return False
+                db.execute('INSERT OR REPLACE INTO price_refresh_lease (id, holder, expires_at) VALUES (1, ?, ?)',
+                           (self.holder, now + self.lease_seconds))
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        return True
+
+    def release_lease(self):
+        with self._connection() as db:
+            db.execute('DELETE FROM price_refresh_lease WHERE id = 1 AND holder = ?', (self.holder,))
+
+class PriceCache:
+    """
+    Stale-while-revalidate cache of item prices.
+
+    Readers always get the current snapshot immediately. Once it is older
+    than max_age a single background thread reloads it; other readers keep
+    using the old snapshot until the new one is swapped in. A failed load
+    keeps the old prices and is retried after retry_interval.
+
+    With a store, the snapshot is shared with the other worker processes:
+    it is loaded from the store at startup, newer versions written by
+    other processes are picked up every sync_interval seconds by a watch
+    thread, started on the first read, and only the process holding the
+    store's lease calls the price source. Requests never parse or diff a
+    snapshot themselves.
+
+    on_change is called with a PriceDiff, in the refreshing thread, when a
+    refresh changes any price. Callbacks added with subscribe are called
+    with the new snapshot and its PriceDiff whenever this process starts
+    serving a new snapshot, whether it refreshed it or picked it up from
+    the store.
+    """
+
+    def __init__(self, load, max_age=300, retry_interval=30, store=None, sync_interval=1, on_change=None):
+        self.load = load
+        self.on_change = on_change
+        self.max_age = max_age
+        self.retry_interval = retry_interval
+        self.store = store
+        self.sync_interval = sync_interval
+        self._snapshot = EMPTY_SNAPSHOT
+        self._refreshing = False
+        self._next_attempt = 0
+        self._next_sync = 0
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._watcher_pid = None
+        snapshot_age.set_function(lambda: self._snapshot.age() or 0)
+        if store is not None:
+            self._sync(time.time())
+
+    @property
+    def snapshot(self):
+        """The current snapshot, scheduling a background refresh if it is stale"""
+        if self.store is not None and self._watcher_pid != os.getpid():
+            self.watch()
+        if time.time() >= self._next_attempt:
+            self._refresh_in_background()
+        return self._snapshot
+
+    def get(self, item_name, default=None):
+        return self.snapshot.prices.get(item_name, default)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def watch(self):
+        """Keep syncing and refreshing in a background thread even when nothing reads prices"""
+        with self._lock:
+            # Compared by process, as a worker forked from a preloaded app doesn't inherit the thread
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+
+        def run():
+            while True:
+                now = time.time()
+                if self.store is not None and now >= self._next_sync:
+                    self._sync(now)
+                if now >= self._next_attempt:
+                    self._refresh_in_background()
+                time.sleep(self.sync_interval)
+
+        threading.Thread(target=run, name='price-watch', daemon=True).start()
+
+    def _notify(self, snapshot, diff):
+        for callback in self._subscribers:
+            try:
+                callback(snapshot, diff)
+            except Exception as e:
+                print(f"Error notifying price subscriber: {str(e)}")
+
+    def _swap(self, snapshot):
+        """Serve snapshot from now on; caller holds the lock"""
+        self._snapshot = snapshot
+        self._next_attempt = max(self._next_attempt, snapshot.loaded_at + self.max_age)
+        snapshot_version.set(snapshot.version)
+
+    def _sync(self, now):
+        """Adopt a newer snapshot written to the store by another process"""
+        self._next_sync = now + self.sync_interval
+        try:
+            version, _ = self.store.version()
+            if version <= self._snapshot.version:
+                return
+            snapshot = self.store.load()
+        except sqlite3.Error as e:
+            print(f"Error reading price snapshot: {str(e)}")
+            return
+        with self._lock:
+            previous = self._snapshot
+            if snapshot is None or snapshot.version <= previous.version:
+                return
+            self._swap(snapshot)
+        if self._subscribers:
+            self._notify(snapshot, diff_prices(previous.prices, snapshot.prices))
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing or time.time() < self._next_attempt:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='price-refresh', daemon=True).start()
+
+    def refresh(self):
+        """Reload prices in the calling thread unless a refresh is already running"""
+        with self._lock:
+            if self._refreshing:
+                return self._snapshot
+            self._refreshing = True
+        return self._refresh()
+
+    def _refresh(self):
+        leased = False
+        try:
+            if self.store is not None:
+                try:
+                    leased = self.store.acquire_lease()
+                except sqlite3.Error as e:
+                    print(f"Error acquiring price refresh lease: {str(e)}")
+                if not leased:
+                    # Another process is refreshing; its snapshot arrives with the next sync
+                    with self._lock:
+                        self._next_attempt = time.time() + self.retry_interval
+                    return self._snapshot
+                self._sync(time.time())
+                if self._snapshot.loaded_at + self.max_age > time.time():
+                    return self._snapshot
+            return self._load()
+        finally:
+            if leased:
+                try:
+                    self.store.release_lease()
+                except sqlite3.Error as e:
+                    print(f"Error releasing price refresh lease: {str(e)}")
+            with self._lock:
+                self._refreshing = False
+
+    def _load(self):
+        """Call the price source and publish what it returns"""
+        start = time.perf_counter()
+        prices = None
+        try:
+            prices = self.load()
+        except Exception as e:
+            print(f"Error refreshing prices: {str(e)}")
+        finally:
+            refresh_seconds.observe(time.perf_counter() - start)
+
+        if not prices:
+            # Keep serving the previous snapshot and try again later
+            refresh_failures.inc()
+            with self._lock:
+                self._next_attempt = time.time() + self.retry_interval
+            return self._snapshot
+
+        previous = self._snapshot
+        snapshot = None
+        if self.store is not None:
+            try:
+                snapshot = self.store.save(prices)
+            except sqlite3.Error as e:
+                print(f"Error saving price snapshot: {str(e)}")
+        with self._lock:
+            if snapshot is None:
+                snapshot = PriceSnapshot(self._snapshot.version + 1, prices, time.time())
+            self._swap(snapshot)
+
+        diff = diff_prices(previous.prices, snapshot.prices)
+        self._notify(snapshot, diff)
+        if previous.version and diff:
+            print(f"Prices updated to version {snapshot.version}: {diff.summary()}")
+            price_changes.inc(len(diff.changed), kind='changed')
+            price_changes.inc(len(diff.added), kind='added')
+            price_changes.inc(len(diff.removed), kind='removed')
+            if self.on_change is not None:
+                try:
+                    self.on_change(diff)
+                except Exception as e:
+                    print(f"Error handling price changes: {str(e)}")
+        return snapshot
@@ -0,0 +1,108 @@
+import csv
+import sqlite3
+
+def _clean_price(value):
+    if isinstance(value, str):
+        return value.strip().replace('$', '').replace(',', '')
+    return value
+
+def prices_from_rows(rows):
+    """
+    Build a dictionary of item names and prices from (name, price) rows in bulk.
+
+    Rows without both cells are skipped. All prices are converted in one
+    pass; only when that fails are the rows converted one by one, so bad
+    rows can be reported and skipped.
+    """
+    rows = [row for row in rows if len(row) >= 2 and row[0] is not None and row[1] is not None]
+    names = [str(row[0]).strip() for row in rows]
+    try:
+        return dict(zip(names, map(float, map(_clean_price, (row[1] for row in rows)))))
+    except (ValueError, TypeError):
+        pass
+
+    prices = {}
+    for name, row in zip(names, rows):
+        try:
+            prices[name] = float(_clean_price(row[1]))
+        except (ValueError, TypeError) as e:
+            print(f"Error processing row {row}: {e}")
+    return prices
+
+class PriceSource:
+    """Somewhere item prices can be loaded from"""
+    kind = None
+
+    def load(self):
+        """Return a dictionary of item names and prices; raise or return {} on failure"""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__}>'
+
+class SheetsPriceSource(PriceSource):
+    """Prices from the Google Sheet configured in sheets_helper"""
+    kind = 'sheets'
+
+    def load(self):
+        from sheets_helper import get_sheet_data
+        return get_sheet_data()
+
+class CsvPriceSource(PriceSource):
+    """
+    Prices from a local CSV file of item name and price columns.
+
+    The file is read through the csv module in one buffered pass, without
+    holding a copy of its text; the first row is a header, as in the
+    spreadsheet.
+    """
+    kind = 'csv'
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        with open(self.path, newline='', encoding='utf-8-sig') as f:
+            rows = csv.reader(f)
+            next(rows, None)  # Skip header row
+            return prices_from_rows(rows)
+
+    def __repr__(self):
+        return f'<CsvPriceSource {self.path}>'
+
+class SqlitePriceSource(PriceSource):
+    """Prices from a table of item names and prices in a local SQLite database"""
+    kind = 'sqlite'
+
+    def __init__(self, path, table='prices', name_column='name', price_column='price'):
+        self.path = path
+        self.query = f'SELECT "{name_column}", "{price_column}" FROM "{table}"'
+
+    def load(self):
+        # Read-only, so a missing database is an error rather than a new empty file
+        db = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        try:
+            rows = db.execute(self.query).fetchall()
+        finally:
+            db.close()
+        if all(type(price) is float and type(name) is str for name, price in rows):
+            return {name.strip(): price for name, price in rows}
+        return prices_from_rows(rows)
+
+    def __repr__(self):
+        return f'<SqlitePriceSource {self.path}>'
+
+PRICE_SOURCES = {source.kind: source for source in (SheetsPriceSource, CsvPriceSource, SqlitePriceSource)}
+
+def get_price_source(kind='sheets', path=None, table=None):
+    """Create the price source named by kind ('sheets', 'csv' or 'sqlite')"""
+    source = PRICE_SOURCES.get(kind)
+    if source is None:
+        raise ValueError(f"Unknown price source {kind!r}, expected one of {', '.join(PRICE_SOURCES)}")
+    if source is SheetsPriceSource:
+        return source()
+    if not path:
+        raise ValueError(f'The {kind} price source needs a file path')
+    if source is SqlitePriceSource:
+        return source(path, table or 'prices')
+    return source(path)
@@ -0,0 +1,166 @@
+import csv
+import os
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+import numpy as np
+
+def to_cents(amounts):
+    """Dollar amounts (floats, as stored on items) to int64 cents"""
+    return np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+
+def percent_to_basis_points(percent):
+    """'8.25' percent to 825 basis points, rounded half up"""
+    return int((Decimal(str(percent or 0)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def apply_basis_points(cents, basis_points):
+    """Scale integer cents by (10000 + basis_points) / 10000, rounding half up"""
+    return (cents * (10000 + basis_points) + 5000) // 10000
+
+def format_cents(cents):
+    """12345 -> '$123.45'"""
+    cents = int(cents)
+    sign = '-' if cents < 0 else ''
+    return f'{sign}${abs(cents) // 100:,}.{abs(cents) % 100:02d}'
+
+class TierTable:
+    """
+    Quantity-break prices for item names.
+
+    Every break is a (minimum quantity, unit price) pair. The breaks of all
+    names are kept in one array sorted by (name, minimum quantity), so a
+    whole column of lines is matched to its breaks with one searchsorted.
+    """
+
+    def __init__(self, tiers=None):
+        tiers = tiers or {}
+        self.names = {name: index for index, name in enumerate(sorted(tiers))}
+        groups, minimums, prices = [], [], []
+        for name, index in self.names.items():
+            for minimum, price in sorted(tiers[name]):
+                groups.append(index)
+                minimums.append(minimum)
+                prices.append(price)
+        self.groups = np.asarray(groups, dtype=np.int64)
+        self.minimums = np.asarray(minimums, dtype=np.int64)
+        self.cents = to_cents(prices)
+        self._keys = self._key(self.groups, self.minimums)
+
+    def __len__(self):
+        return len(self.names)
+
+    @staticmethod
+    def _key(groups, quantities):
+        # Quantities are far below 2**32, so (group, quantity) packs into one sortable int64
+        return (groups << 32) + np.clip(quantities, 0, 2 ** 32 - 1)
+
+    def group_of(self, names):
+        """Tier group index of each name, -1 for names without breaks"""
+        lookup = self.names.get
+        return np.fromiter((lookup(name, -1) for name in names), dtype=np.int64, count=len(names))
+
+    def unit_cents(self, groups, quantities, base_cents):
+        """Unit price of each line: the best break its quantity reaches, else its base price"""
+        if not len(self._keys):
+            return base_cents
+        index = np.searchsorted(self._keys, self._key(np.maximum(groups, 0), quantities), side='right') - 1
+        safe = np.maximum(index, 0)
+        matched = (groups >= 0) & (index >= 0) & (self.groups[safe] == groups)
+        return np.where(matched, self.cents[safe], base_cents)
+
+class PricingRules:
+    """Markup and tax, in basis points, and the quantity breaks to price with"""
+
+    def __init__(self, markup_bp=0, tax_bp=0, tiers=None):
+        self.markup_bp = markup_bp
+        self.tax_bp = tax_bp
+        self.tiers = tiers or TierTable()
+
+class PricingResult:
+    """Unit and line amounts per line and totals per project, all in integer cents"""
+
+    def __init__(self, unit_cents, line_cents, subtotal_cents, tax_cents):
+        self.unit_cents = unit_cents
+        self.line_cents = line_cents
+        self.subtotal_cents = subtotal_cents
+        self.tax_cents = tax_cents
+        self.total_cents = subtotal_cents + tax_cents
+
+def price_lines(quantities, base_cents, groups, rules, projects=None, project_count=1):
+    """
+    Price many lines in one vectorized pass.
+
+    quantities, base_cents and groups (from TierTable.group_of) are equal
+    length arrays; projects optionally gives each line's project index so
+    many projects are totalled at once. Each unit price is the quantity
+    break it reaches (or its base price) with markup applied and rounded to
+    the cent, so a line is exactly quantity times its unit price. Tax is
+    applied to each project's subtotal.
+    """
+    quantities = np.asarray(quantities, dtype=np.int64)
+    base_cents = np.asarray(base_cents, dtype=np.int64)
+    unit_cents = apply_basis_points(rules.tiers.unit_cents(np.asarray(groups, dtype=np.int64), quantities, base_cents),
+                                    rules.markup_bp)
+    line_cents = quantities * unit_cents
+    if projects is None:
+        subtotal_cents = np.asarray([line_cents.sum()], dtype=np.int64)
+    else:
+        # Summed in int64, so project subtotals stay exact to the cent
+        subtotal_cents = np.zeros(project_count, dtype=np.int64)
+        np.add.at(subtotal_cents, projects, line_cents)
+    tax_cents = apply_basis_points(subtotal_cents, rules.tax_bp) - subtotal_cents
+    return PricingResult(unit_cents, line_cents, subtotal_cents, tax_cents)
+
+def price_items(items, rules):
+    """Price a single project's items (anything with name, quantity and price)"""
+    items = list(items)
+    return price_lines([item.quantity for item in items], to_cents([item.price for item in items]),
+                       rules.tiers.group_of([item.name for item in items]), rules)
+
+# Quantity-break files are re-read when their modification time changes
+_tier_cache = {}
+_tier_lock = threading.Lock()
+
+def load_tier_table(path):
+    """
+    Read quantity breaks from a CSV of item name, minimum quantity and unit price.
+
+    Returns an empty table when no path is configured or the file is
+    missing, and skips rows that can't be read, so a bad file never stops
+    items from being priced. Problems are reported once per file version.
+    """
+    if not path:
+        return TierTable()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    with _tier_lock:
+        cached = _tier_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+    tiers = {}
+    if mtime is None:
+        print(f"Quantity breaks file {path} not found; pricing without quantity breaks")
+    else:
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                rows = csv.reader(f)
+                next(rows, None)  # Skip header row
+                for row in rows:
+                    if len(row) < 3 or not row[0].strip():
+                        continue
+                    try:
+                        minimum = int(row[1].strip())
+                        price = float(row[2].strip().replace('$', '').replace(',', ''))
+                    except ValueError as e:
+                        print(f"Error processing quantity break row {row}: {e}")
+                        continue
+                    tiers.setdefault(row[0].strip(), []).append((minimum, price))
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            print(f"Error reading quantity breaks from {path}: {str(e)}")
+            tiers = {}
+    table = TierTable(tiers)
+    with _tier_lock:
+        _tier_cache[path] = (mtime, table)
+    return table
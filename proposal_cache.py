@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Bump when the rendering code changes in a way that alters the output
+RENDER_VERSION = 3
+
+def proposal_cache_key(values, items, template_digest):
+    """
+    Build a content-addressed key for a rendered proposal.
+
+    The key covers the placeholder values, every item row and the template
+    file, so any change to one of them produces a different key.
+    """
+    payload = json.dumps({
+        'version': RENDER_VERSION,
+        'template': template_digest,
+        'values': values,
+        'items': [[item.id, item.name, item.quantity, item.price] for item in items],
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ProposalCache:
+    """
+    Two-tier cache of rendered proposals.
+
+    Recent documents are kept in memory with LRU eviction; every document is
+    also written to disk so other workers (and restarts) can serve it with
+    send_file, which hands the file to the server's sendfile support.
+    """
+
+    def __init__(self, directory, max_memory_bytes=64 * 1024 * 1024, max_disk_entries=500):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._project_keys = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f'{key}.docx')
+
+    def get(self, key):
+        """Return the cached bytes or the on-disk path for key, or None on a miss"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            try:
+                os.utime(path)  # Keep recently used files out of the disk eviction
+            except OSError:
+                pass
+            return path
+        return None
+
+    def put(self, project_id, key, data):
+        """Store a rendered proposal and drop the project's previous entry"""
+        with self._lock:
+            previous_key = self._project_keys.get(project_id)
+            self._project_keys[project_id] = key
+            if previous_key is not None and previous_key != key:
+                self._discard(previous_key)
+
+            if len(data) <= self.max_memory_bytes:
+                self._memory[key] = data
+                self._memory_bytes += len(data)
+                while self._memory_bytes > self.max_memory_bytes:
+                    _, evicted = self._memory.popitem(last=False)
+                    self._memory_bytes -= len(evicted)
+
+        # Write atomically so a concurrent reader never sees a partial file
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._disk_path(key))
+            self._prune_disk()
+        except OSError as e:
+            print(f"Error writing proposal cache entry {key}: {str(e)}")
+
+    def invalidate(self, project_id):
+        """Forget the cached proposal of a project after it changes"""
+        with self._lock:
+            key = self._project_keys.pop(project_id, None)
+            if key is not None:
+                self._discard(key)
+
+    def _discard(self, key):
+        data = self._memory.pop(key, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _prune_disk(self):
+        """Remove the least recently used files once the disk tier is full"""
+        entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith('.docx')]
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
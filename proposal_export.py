@@ -0,0 +1,97 @@
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from proposal_template import get_template
+
+class _ChunkSink:
+    """Write-only file object that collects what zipfile writes so it can be yielded"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return b''.join(chunks)
+
+def render_document(template_path, placeholders):
+    """Render one proposal to .docx bytes; runs inside the export worker processes"""
+    return get_template(template_path).render(placeholders)
+
+def _warm_worker(template_path):
+    """Parse the template once per worker process"""
+    get_template(template_path)
+
+def stream_proposal_zip(entries, template_path, max_workers=None, cache_keys=None, read_cached=None):
+    """
+    Render proposals across a process pool and yield a ZIP archive as it is built.
+
+    entries is a list of (archive name, placeholder values) pairs. Each
+    document is added to the archive as soon as it finishes, and at most a
+    few documents per worker are in flight, so memory stays flat no matter
+    how many proposals are exported. cache_keys maps archive names to the
+    keys their documents may already be cached under; read_cached(key)
+    returns such a document, or None if it is not cached after all, and is
+    called for one document at a time, just before it is added.
+    """
+    cache_keys = cache_keys or {}
+    max_workers = max_workers or os.cpu_count() or 1
+    sink = _ChunkSink()
+    # The sink is not seekable, so zipfile writes data descriptors after each member
+    archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED)
+    date_time = time.localtime()[:6]
+
+    def add(name, data):
+        # .docx files are already deflated, store them as they are
+        archive.writestr(zipfile.ZipInfo(name, date_time=date_time), data)
+        return sink.drain()
+
+    pending = []
+    for name, placeholders in entries:
+        data = read_cached(cache_keys[name]) if name in cache_keys else None
+        if data is None:
+            pending.append((name, placeholders))
+            continue
+        yield add(name, data)
+
+    if pending:
+        # spawn keeps the workers free of locks held by threads in the web process
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(pending)), mp_context=context,
+                                 initializer=_warm_worker, initargs=(template_path,)) as executor:
+            queue = iter(pending)
+            in_flight = {}
+
+            def fill():
+                while len(in_flight) < max_workers * 2:
+                    entry = next(queue, None)
+                    if entry is None:
+                        return
+                    name, placeholders = entry
+                    in_flight[executor.submit(render_document, template_path, placeholders)] = name
+
+            fill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        print(f"Error rendering proposal {name}: {str(e)}")
+                        archive.writestr(zipfile.ZipInfo(f'{name}.error.txt', date_time=date_time), str(e))
+                        yield sink.drain()
+                        continue
+                    yield add(name, data)
+                fill()
+
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,215 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from metrics import registry
+
+queue_depth = registry.gauge('proposal_queue_depth', 'Proposal render jobs waiting for a worker')
+jobs_running = registry.gauge('proposal_jobs_running', 'Proposal render jobs currently rendering')
+queue_wait_seconds = registry.histogram('proposal_queue_wait_seconds', 'Time a render job waited for a worker')
+render_seconds = registry.histogram('proposal_render_seconds', 'Time spent rendering a proposal', ['mode'])
+jobs_total = registry.counter('proposal_jobs_total', 'Finished proposal render jobs', ['status'])
+
+class QueueFullError(Exception):
+    """Raised when the render queue is at capacity"""
+    pass
+
+# Columns of a job row, in the order RenderJob.from_row reads them
+JOB_COLUMNS = ('id', 'project_id', 'download_name', 'status', 'error', 'cache_key',
+               'created_at', 'started_at', 'finished_at')
+
+class RenderJob:
+    """A proposal render waiting in, or finished by, the render queue"""
+
+    def __init__(self, project_id, download_name):
+        self.id = uuid.uuid4().hex
+        self.project_id = project_id
+        self.download_name = download_name
+        self.status = 'queued'
+        self.error = None
+        self.cache_key = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    @classmethod
+    def from_row(cls, row):
+        """A job as stored in the JobStore, possibly queued by another process"""
+        job = cls.__new__(cls)
+        (job.id, job.project_id, job.download_name, job.status, job.error, job.cache_key,
+         job.created_at, job.started_at, job.finished_at) = row
+        job.done = threading.Event()
+        if job.finished_at is not None:
+            job.done.set()
+        return job
+
+    def as_row(self):
+        return tuple(getattr(self, column) for column in JOB_COLUMNS)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'project_id': self.project_id,
+            'status': self.status,
+            'error': self.error,
+            'queued_seconds': round((self.started_at or time.time()) - self.created_at, 3),
+            'render_seconds': round(self.finished_at - self.started_at, 3) if self.finished_at and self.started_at else None,
+        }
+
+class JobStore:
+    """
+    Render job states kept in a local SQLite file.
+
+    Every worker process on the host reads the same file, so a job's status
+    and download can be asked for from whichever worker a request lands on,
+    not only the one rendering it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS proposal_job ('
+                       'id TEXT PRIMARY KEY, project_id INTEGER NOT NULL, download_name TEXT NOT NULL, '
+                       'status TEXT NOT NULL, error TEXT, cache_key TEXT, created_at REAL NOT NULL, '
+                       'started_at REAL, finished_at REAL)')
+
+    @contextmanager
+    def _connection(self):
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def save(self, job):
+        with self._connection() as db:
+            db.execute(f'INSERT OR REPLACE INTO proposal_job ({", ".join(JOB_COLUMNS)}) '
+                       f'VALUES ({", ".join("?" * len(JOB_COLUMNS))})', job.as_row())
+
+    def get(self, job_id):
+        with self._connection() as db:
+            row = db.execute(f'SELECT {", ".join(JOB_COLUMNS)} FROM proposal_job WHERE id = ?',
+                             (job_id,)).fetchone()
+        return RenderJob.from_row(row) if row else None
+
+    def expire(self, before):
+        """Drop jobs created before the given time"""
+        with self._connection() as db:
+            db.execute('DELETE FROM proposal_job WHERE created_at < ?', (before,))
+
+class RenderQueue:
+    """
+    Bounded pool of background workers rendering proposals.
+
+    Jobs are handed a render callable that needs no request or database
+    context; it returns the cache key its document was stored under. Job
+    states are written to the JobStore as they change, so any worker
+    process can report them.
+    """
+
+    # Seconds between store reads while waiting on another process's job
+    poll_interval = 0.25
+
+    def __init__(self, store, max_workers=2, max_queued=50, job_ttl=900):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='proposal-render')
+        self._jobs = {}
+        self._queued = 0
+        self._lock = threading.Lock()
+
+    def submit(self, project_id, download_name, render):
+        """Enqueue a render and return its job, or raise QueueFullError"""
+        job = RenderJob(project_id, download_name)
+        self._expire_jobs()
+        with self._lock:
+            if self._queued >= self.max_queued:
+                raise QueueFullError('The proposal queue is full, please try again shortly')
+            self._queued += 1
+            self._jobs[job.id] = job
+        try:
+            self.store.save(job)
+        except Exception:
+            # Give the slot back, or every failed save would shrink the queue for good
+            with self._lock:
+                self._queued -= 1
+                del self._jobs[job.id]
+            raise
+        queue_depth.inc()
+        self._executor.submit(self._run, job, render)
+        return job
+
+    def get(self, job_id, wait=0):
+        """
+        Look up a job from any process, waiting up to wait seconds for it to finish.
+
+        A job queued here is waited on directly; one queued by another
+        process is re-read from the store every poll_interval. A job left
+        unfinished past the TTL, by a process that was restarted, is
+        reported as failed.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            if wait > 0:
+                job.done.wait(wait)
+            return job
+
+        deadline = time.monotonic() + wait
+        job = self.store.get(job_id)
+        while job is not None and job.finished_at is None and time.monotonic() < deadline:
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+            job = self.store.get(job_id)
+        if job is not None and job.finished_at is None and job.created_at < time.time() - self.job_ttl:
+            job.status = 'failed'
+            job.error = 'The proposal render was interrupted, please generate it again'
+        return job
+
+    def _run(self, job, render):
+        with self._lock:
+            self._queued -= 1
+        queue_depth.dec()
+        jobs_running.inc()
+        job.started_at = time.time()
+        job.status = 'running'
+        queue_wait_seconds.observe(job.started_at - job.created_at)
+        try:
+            self.store.save(job)
+            job.cache_key = render()
+            job.status = 'done'
+        except Exception as e:
+            print(f"Error rendering proposal for project {job.project_id}: {str(e)}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            try:
+                self.store.save(job)
+            except sqlite3.Error as e:
+                print(f"Error saving proposal job {job.id}: {str(e)}")
+            jobs_running.dec()
+            jobs_total.inc(status=job.status)
+            job.done.set()
+
+    def _expire_jobs(self):
+        """Drop finished jobs older than the TTL"""
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        # Outside the lock, so a slow write doesn't hold up lookups. Stored jobs are kept
+        # twice as long, so a finished job outlives the TTL check in get
+        try:
+            self.store.expire(cutoff - self.job_ttl)
+        except sqlite3.Error as e:
+            print(f"Error expiring proposal jobs: {str(e)}")
@@ -0,0 +1,325 @@
+import bisect
+import copy
+import hashlib
+import io
+import itertools
+import os
+import re
+import struct
+import threading
+import uuid
+import zipfile
+from docx.oxml.ns import qn
+from lxml import etree
+from xml.sax.saxutils import escape as xml_escape
+from metrics import PhaseTimer
+
+WORD_NAMESPACES = {
+    'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main',
+}
+
+# Matches every placeholder spelling, e.g. {{Name}} and {{ Name }}
+PLACEHOLDER_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+# Runs may sit directly in the paragraph or one level down (hyperlinks,
+# tracked insertions); textbox paragraphs nested in a run are excluded.
+_paragraph_text_xpath = etree.XPath('./w:r/w:t | ./*/w:r/w:t', namespaces=WORD_NAMESPACES)
+
+def node_path(element):
+    """Return the child-index path from the document root to an element"""
+    path = []
+    parent = element.getparent()
+    while parent is not None:
+        path.append(parent.index(element))
+        element, parent = parent, parent.getparent()
+    return tuple(reversed(path))
+
+def resolve_path(root, path):
+    """Find the element at a child-index path below root"""
+    element = root
+    for index in path:
+        element = element[index]
+    return element
+
+def paragraph_text_nodes(paragraph):
+    """Return the w:t elements that belong directly to a w:p element"""
+    return _paragraph_text_xpath(paragraph)
+
+def paragraph_region(paragraph):
+    """Classify a paragraph as textbox, table or plain paragraph content"""
+    region = 'paragraphs'
+    for ancestor in paragraph.iterancestors(qn('w:txbxContent'), qn('w:tc')):
+        if ancestor.tag == qn('w:txbxContent'):
+            return 'textboxes'
+        region = 'tables'
+    return region
+
+def placeholder_spans(texts):
+    """
+    Find which text nodes each placeholder spans.
+
+    Returns (first, last) node index pairs, merged where placeholders share
+    a node, so every match lies entirely within one span.
+    """
+    full_text = ''.join(texts)
+    if '{{' not in full_text:
+        return []
+
+    ends = list(itertools.accumulate(len(text) for text in texts))
+    spans = []
+    for match in PLACEHOLDER_PATTERN.finditer(full_text):
+        first = bisect.bisect_right(ends, match.start())
+        last = bisect.bisect_right(ends, match.end() - 1)
+        if spans and first <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], last)
+        else:
+            spans.append([first, last])
+    return spans
+
+def replace_placeholders(nodes, values):
+    """
+    Substitute placeholders across a run of w:t elements in a single pass.
+
+    Each replacement is spliced into the node where its placeholder starts
+    and the rest of the placeholder is cut from the following nodes, so every
+    run keeps its own formatting. Placeholders without a value are left as is.
+    """
+    texts = [node.text or '' for node in nodes]
+    full_text = ''.join(texts)
+    starts = [0]
+    for text in texts[:-1]:
+        starts.append(starts[-1] + len(text))
+
+    changed = set()
+    # Work backwards so the offsets of earlier matches stay valid
+    for match in reversed(list(PLACEHOLDER_PATTERN.finditer(full_text))):
+        value = values.get(match.group(1))
+        if not isinstance(value, str):
+            continue
+
+        # The last node starting at or before an offset is the one holding it
+        first = bisect.bisect_right(starts, match.start()) - 1
+        last = bisect.bisect_right(starts, match.end() - 1) - 1
+        head = match.start() - starts[first]
+        tail = match.end() - starts[last]
+        if first == last:
+            texts[first] = texts[first][:head] + value + texts[first][tail:]
+        else:
+            texts[first] = texts[first][:head] + value
+            for index in range(first + 1, last):
+                texts[index] = ''
+            texts[last] = texts[last][tail:]
+        changed.update(range(first, last + 1))
+
+    for index in changed:
+        node = nodes[index]
+        node.text = texts[index]
+        if texts[index] != texts[index].strip():
+            node.set(XML_SPACE, 'preserve')
+    return bool(changed)
+
+# Parts that may hold placeholders; everything else in the package is copied verbatim
+PLACEHOLDER_PARTS = re.compile(r'^word/(document|header\d*|footer\d*)\.xml$')
+
+def copy_raw_member(archive, source, info):
+    """
+    Copy a member from the source zip bytes into archive without recompressing it.
+
+    The local header is rebuilt from the central directory entry and the
+    already-compressed data is written as is.
+    """
+    header = source[info.header_offset:info.header_offset + 30]
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    start = info.header_offset + 30 + name_length + extra_length
+    data = source[start:start + info.compress_size]
+
+    member = copy.copy(info)
+    member.flag_bits &= ~0x08  # Sizes go in the local header, no data descriptor
+    member.header_offset = archive.fp.tell()
+    archive.fp.write(member.FileHeader())
+    archive.fp.write(data)
+    archive.filelist.append(member)
+    archive.NameToInfo[member.filename] = member
+    archive.start_dir = archive.fp.tell()
+    archive._didModify = True
+
+# A table row holding one of these markers is a prototype, repeated once per
+# line item ({{LineItems}}) or once per item name ({{LineItemsByName}})
+LINE_ITEM_MARKERS = ('LineItems', 'LineItemsByName')
+
+# Placeholders inside a prototype row once every spelling is normalized
+_row_field_pattern = re.compile(r'\{\{(\w+)\}\}')
+
+def compile_line_item_row(row, nsmap):
+    """
+    Turn a prototype table row into a list of alternating XML chunks and field names.
+
+    Every placeholder in the row is first collapsed into a single w:t, so
+    rows can later be produced by joining strings and spliced into the
+    serialized part without being parsed. Namespace declarations the part
+    root already makes are dropped from the row.
+    """
+    row = copy.deepcopy(row)
+    for paragraph in row.iter(qn('w:p')):
+        nodes = paragraph_text_nodes(paragraph)
+        texts = [node.text or '' for node in nodes]
+        names = {match.group(1) for match in PLACEHOLDER_PATTERN.finditer(''.join(texts))}
+        if not names:
+            continue
+        replace_placeholders(nodes, {name: '' if name in LINE_ITEM_MARKERS else f'{{{{{name}}}}}' for name in names})
+        for node in nodes:
+            if node.text and '{{' in node.text:
+                node.set(XML_SPACE, 'preserve')
+    xml = etree.tostring(row, encoding='unicode')
+    tag_end = xml.index('>')
+    start_tag = re.sub(r'\sxmlns:(\w+)="([^"]*)"',
+                       lambda match: '' if nsmap.get(match.group(1)) == match.group(2) else match.group(0),
+                       xml[:tag_end])
+    return _row_field_pattern.split(start_tag + xml[tag_end:])
+
+def build_line_item_rows(chunks, rows, values):
+    """Produce the XML of every expanded row from a compiled prototype"""
+    fields = chunks[1::2]
+    statics = chunks[0::2]
+    output = []
+    for row in rows:
+        for static, field in zip(statics, fields):
+            output.append(static)
+            value = row.get(field, values.get(field))
+            output.append(xml_escape(value) if isinstance(value, str) else f'{{{{{field}}}}}')
+        output.append(statics[-1])
+    return output
+
+class ProposalTemplate:
+    """
+    A proposal template parsed once, together with an index of the exact
+    text elements (in body paragraphs, table cells, textboxes, headers and
+    footers) that hold placeholders.
+
+    Rendering rewrites only the XML parts that contain placeholders; every
+    other member of the package, such as embedded images, is copied across
+    as raw compressed bytes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.digest = hashlib.sha256(self.data).hexdigest()
+        self.parts = {}
+        self.text_groups = {}
+        self.line_item_rows = {}
+        self.row_token = f'line-items-{uuid.uuid4().hex}'
+
+        with zipfile.ZipFile(io.BytesIO(self.data)) as package:
+            self.members = package.infolist()
+            for info in self.members:
+                if PLACEHOLDER_PARTS.match(info.filename):
+                    self._index_part(info.filename, package.read(info))
+
+    def _index_part(self, name, xml):
+        """Parse a part once and record where its placeholders live"""
+        root = etree.fromstring(xml)
+        groups = {}
+        line_item_rows = []
+        for row in root.iter(qn('w:tr')):
+            row_text = ''.join(node.text or '' for node in row.iter(qn('w:t')))
+            markers = [match.group(1) for match in PLACEHOLDER_PATTERN.finditer(row_text)
+                       if match.group(1) in LINE_ITEM_MARKERS]
+            if markers:
+                line_item_rows.append((node_path(row), markers[0], compile_line_item_row(row, root.nsmap)))
+        prototypes = {resolve_path(root, path) for path, _, _ in line_item_rows}
+
+        # Every w:p in the part, including table cells and textbox content
+        for paragraph in root.iter(qn('w:p')):
+            if prototypes and any(row in prototypes for row in paragraph.iterancestors(qn('w:tr'))):
+                continue  # Prototype rows are filled per line item
+            nodes = paragraph_text_nodes(paragraph)
+            spans = placeholder_spans([node.text or '' for node in nodes])
+            if spans:
+                region = groups.setdefault(paragraph_region(paragraph), [])
+                for first, last in spans:
+                    region.append([node_path(node) for node in nodes[first:last + 1]])
+        if groups or line_item_rows:
+            self.parts[name] = root
+            self.text_groups[name] = groups
+            self.line_item_rows[name] = line_item_rows
+
+    @property
+    def placeholder_count(self):
+        return sum(len(paths) for groups in self.text_groups.values() for paths in groups.values())
+
+    def render_part(self, name, values, timer):
+        """Deep-copy one parsed part and fill in its indexed placeholders"""
+        label = os.path.splitext(os.path.basename(name))[0]
+        with timer.phase(f'copy.{label}'):
+            root = copy.deepcopy(self.parts[name])
+            # Resolve prototype rows before any row expansion shifts sibling indexes
+            prototypes = [(resolve_path(root, path), marker, chunks)
+                          for path, marker, chunks in self.line_item_rows[name]]
+        for region, groups in self.text_groups[name].items():
+            with timer.phase(f'fill.{label}.{region}'):
+                for paths in groups:
+                    replace_placeholders([resolve_path(root, path) for path in paths], values)
+        # Prototype rows become comments that the generated rows replace after serializing
+        expansions = []
+        with timer.phase(f'fill.{label}.line_items'):
+            for index, (row, marker, chunks) in enumerate(prototypes):
+                token = f'{self.row_token}-{index}'
+                row.getparent().replace(row, etree.Comment(token))
+                rows = build_line_item_rows(chunks, values.get(marker) or [], values)
+                expansions.append((f'<!--{token}-->'.encode('utf-8'), ''.join(rows).encode('utf-8')))
+        with timer.phase(f'serialize.{label}'):
+            xml = etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+            for token, rows in expansions:
+                xml = xml.replace(token, rows, 1)
+            return xml
+
+    def render(self, values, timer=None):
+        """
+        Fill in placeholder values and return the finished .docx bytes.
+
+        values maps placeholder names (without braces) to their text; the
+        LineItems and LineItemsByName entries are lists of per-row values for
+        prototype table rows. Only the indexed text elements and rows of
+        copies of the placeholder parts are touched. When a PhaseTimer is
+        given, the copy, fill (per part and region), serialize and package
+        steps are recorded on it.
+        """
+        timer = timer or PhaseTimer()
+        output = io.BytesIO()
+        with zipfile.ZipFile(output, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for info in self.members:
+                if info.filename in self.parts:
+                    xml = self.render_part(info.filename, values, timer)
+                    with timer.phase('package'):
+                        member = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                        member.compress_type = zipfile.ZIP_DEFLATED
+                        archive.writestr(member, xml)
+                else:
+                    with timer.phase('package'):
+                        copy_raw_member(archive, self.data, info)
+        return output.getvalue()
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+def get_template(path):
+    """Return the parsed template for path, re-parsing only when the file changes"""
+    mtime = os.path.getmtime(path)
+    template = _templates.get(path)
+    if template is not None and template.mtime == mtime:
+        return template
+
+    with _templates_lock:
+        template = _templates.get(path)
+        if template is None or template.mtime != mtime:
+            template = ProposalTemplate(path)
+            _templates[path] = template
+            print(f"Loaded proposal template {path}: {template.placeholder_count} placeholder locations "
+                  f"and {sum(map(len, template.line_item_rows.values()))} line item rows "
+                  f"in {len(template.parts)} parts")
+        return template
@@ -0,0 +1,102 @@
+import numpy as np
+from sqlalchemy import bindparam, select
+from models import db, Item, Project
+from pricing import price_lines, to_cents
+
+# Item names per batch of UPDATE parameters and project lookups
+BATCH_SIZE = 1000
+
+class RepriceResult:
+    """What a re-pricing run changed"""
+
+    def __init__(self):
+        self.items_updated = 0
+        self.project_ids = set()
+        # Project totals in cents before and after, when priced with rules
+        self.totals_before = {}
+        self.totals_after = {}
+
+    def summary(self):
+        summary = f'{self.items_updated} items in {len(self.project_ids)} projects'
+        if self.totals_after:
+            change = sum(self.totals_after.values()) - sum(self.totals_before.values())
+            summary += f' (project totals {"+" if change >= 0 else "-"}${abs(change) / 100:,.2f})'
+        return summary
+
+def _batches(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def project_totals(project_ids, rules):
+    """
+    Total in cents of each project, priced with rules.
+
+    The saved items of all the projects are read as columns and priced in
+    one vectorized pass, grouped by project.
+    """
+    project_ids = sorted(project_ids)
+    if not project_ids:
+        return {}
+    items = Item.__table__
+    columns = ([], [], [], [])
+    connection = db.session.connection()
+    for batch in _batches(project_ids):
+        rows = connection.execute(select(items.c.project_id, items.c.name, items.c.quantity, items.c.price)
+                                  .where(items.c.project_id.in_(batch)))
+        for column, values in zip(columns, zip(*rows)):
+            column.extend(values)
+    owners, names, quantities, prices = columns
+
+    ids = np.asarray(project_ids, dtype=np.int64)
+    projects = np.searchsorted(ids, np.asarray(owners, dtype=np.int64))
+    result = price_lines(quantities, to_cents(prices), rules.tiers.group_of(names), rules,
+                         projects=projects, project_count=len(ids))
+    return dict(zip(project_ids, result.total_cents.tolist()))
+
+def reprice_items(prices, unsent_only=False, rules=None):
+    """
+    Set the saved price of every item whose name is in prices.
+
+    prices maps item names to their new price. The updates run as a few
+    executemany UPDATE statements of BATCH_SIZE names each, not through ORM
+    objects, and only touch rows whose price actually differs. With
+    unsent_only, projects whose proposal was already sent keep their prices.
+    With rules, the totals of the affected projects are priced before and
+    after. Returns a RepriceResult; the caller commits.
+    """
+    result = RepriceResult()
+    if not prices:
+        return result
+
+    items = Item.__table__
+    projects = Project.__table__
+    open_projects = select(projects.c.id).where(projects.c.proposal_sent_at.is_(None))
+
+    saved = select(items.c.project_id, items.c.name, items.c.price)
+    update = (items.update()
+              .where(items.c.name == bindparam('item_name'))
+              .where(items.c.price != bindparam('new_price'))
+              .values(price=bindparam('new_price')))
+    if unsent_only:
+        saved = saved.where(items.c.project_id.in_(open_projects))
+        update = update.where(items.c.project_id.in_(open_projects))
+
+    connection = db.session.connection()
+    for batch in _batches(prices):
+        # Projects with at least one item whose price is about to change
+        rows = connection.execute(saved.where(items.c.name.in_(batch)))
+        result.project_ids.update(project_id for project_id, name, price in rows if price != prices[name])
+
+    if rules is not None:
+        result.totals_before = project_totals(result.project_ids, rules)
+    for batch in _batches(prices):
+        updated = connection.execute(update, [{'item_name': name, 'new_price': prices[name]} for name in batch])
+        result.items_updated += max(updated.rowcount, 0)
+    if rules is not None:
+        result.totals_after = project_totals(result.project_ids, rules)
+    return result
+
+def saved_item_names():
+    """Every distinct item name saved on a project"""
+    return [name for (name,) in db.session.execute(select(Item.name).distinct())]
@@ -1,8 +1,18 @@
+from google.auth.exceptions import TransportError
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+import httplib2
 import json
 import os
+import random
+import socket
+import threading
+import time
 from dotenv import load_dotenv
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from price_sources import prices_from_rows
 
 # Load environment variables
 load_dotenv()
@@ -10,58 +20,199 @@ load_dotenv()
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 SPREADSHEET_ID = os.getenv('GOOGLE_SPREADSHEET_ID', '1VKlVOnVBuNrN4Kb9QaBAP3fGmxZgKdgnu3izx6MkP_k')
 RANGE_NAME = 'Sheet1!A:B'  # Adjust if your sheet name is different
+# Optional override of the Sheets API root, e.g. for a local stand-in server
+API_ENDPOINT = os.getenv('GOOGLE_SHEETS_API_ENDPOINT')
+
+# Timeouts in seconds; the read timeout applies to each socket read once connected.
+# Both are cut short to what is left of FETCH_BUDGET
+CONNECT_TIMEOUT = float(os.getenv('SHEETS_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('SHEETS_READ_TIMEOUT', '15'))
+# Retries of one fetch, with full-jitter exponential backoff, all within FETCH_BUDGET seconds
+FETCH_RETRIES = int(os.getenv('SHEETS_RETRIES', '2'))
+FETCH_BUDGET = float(os.getenv('SHEETS_FETCH_BUDGET', '30'))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Fetches that still fail after their retries count towards opening the breaker
+breaker = CircuitBreaker(
+    'google_sheets',
+    failure_threshold=int(os.getenv('SHEETS_BREAKER_FAILURES', '3')),
+    cooldown=float(os.getenv('SHEETS_BREAKER_COOLDOWN', '120'))
+)
+
+# One client per process; httplib2 connections are not thread-safe, so calls are serialized
+_client_lock = threading.Lock()
+_service = None
+_http = None
+# When the fetch holding _client_lock must be done by, on the time.monotonic clock
+_deadline = None
+
+class BudgetExceededError(socket.timeout):
+    """Raised when a fetch, retries included, runs past FETCH_BUDGET"""
+    pass
+
+def _budget_left():
+    """Seconds left for the current fetch, None outside one; raises once it has run out"""
+    if _deadline is None:
+        return None
+    remaining = _deadline - time.monotonic()
+    if remaining <= 0:
+        raise BudgetExceededError(f'Google Sheets fetch took longer than {FETCH_BUDGET:g}s')
+    return remaining
+
+class _ReadTimeoutMixin:
+    """Connect with CONNECT_TIMEOUT, then read with READ_TIMEOUT, each capped at the budget left"""
+
+    def connect(self):
+        remaining = _budget_left()
+        self.timeout = CONNECT_TIMEOUT if remaining is None else min(CONNECT_TIMEOUT, remaining)
+        super().connect()
+        self._set_read_timeout()
+
+    def getresponse(self):
+        # Kept-alive connections skip connect, so the cap is applied again for every response
+        self._set_read_timeout()
+        return super().getresponse()
+
+    def _set_read_timeout(self):
+        if self.sock is not None:
+            remaining = _budget_left()
+            self.sock.settimeout(READ_TIMEOUT if remaining is None else min(READ_TIMEOUT, remaining))
+
+class _HTTPConnection(_ReadTimeoutMixin, httplib2.HTTPConnectionWithTimeout):
+    pass
+
+class _HTTPSConnection(_ReadTimeoutMixin, httplib2.HTTPSConnectionWithTimeout):
+    pass
+
+class TimeoutHttp(httplib2.Http):
+    """httplib2.Http with separate connect and read timeouts"""
+    connection_types = {'http': _HTTPConnection, 'https': _HTTPSConnection}
+
+    def __init__(self, **kwargs):
+        super().__init__(timeout=CONNECT_TIMEOUT, **kwargs)
+
+    def request(self, uri, *args, connection_type=None, **kwargs):
+        if connection_type is None:
+            connection_type = self.connection_types.get(uri.split(':', 1)[0].lower())
+        return super().request(uri, *args, connection_type=connection_type, **kwargs)
+
+    def abort(self):
+        """Shut down open connections from another thread, so a blocked read ends now"""
+        for connection in list(self.connections.values()):
+            sock = connection.sock
+            if sock is not None:
+                try:
+                    # The plain socket's shutdown, also for TLS, which would otherwise want to talk first
+                    socket.socket.shutdown(sock, socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+def get_credentials():
+    """Build service-account credentials from environment variables"""
+    credentials_dict = {
+        "type": "service_account",
+        "project_id": os.getenv('GOOGLE_PROJECT_ID'),
+        "private_key_id": os.getenv('GOOGLE_PRIVATE_KEY_ID'),
+        "private_key": os.getenv('GOOGLE_PRIVATE_KEY'),
+        "client_email": os.getenv('GOOGLE_CLIENT_EMAIL'),
+        "client_id": os.getenv('GOOGLE_CLIENT_ID'),
+        "auth_uri": os.getenv('GOOGLE_AUTH_URI'),
+        "token_uri": os.getenv('GOOGLE_TOKEN_URI'),
+        "auth_provider_x509_cert_url": os.getenv('GOOGLE_AUTH_PROVIDER_CERT_URL'),
+        "client_x509_cert_url": os.getenv('GOOGLE_CLIENT_CERT_URL')
+    }
+    return service_account.Credentials.from_service_account_info(credentials_dict, scopes=SCOPES)
+
+def get_sheets_service():
+    """
+    Return the process-wide Sheets client, building it on first use.
+
+    The client uses the discovery document bundled with the library and
+    a single authorized HTTP object, so connections are kept alive and
+    access tokens are refreshed in place when they expire. Callers must
+    hold _client_lock.
+    """
+    global _service, _http
+    if _service is None:
+        _http = TimeoutHttp()
+        http = AuthorizedHttp(get_credentials(), http=_http)
+        client_options = {'api_endpoint': API_ENDPOINT} if API_ENDPOINT else None
+        _service = build('sheets', 'v4', http=http, static_discovery=True, cache_discovery=False,
+                         client_options=client_options)
+    return _service
+
+def parse_price_rows(values):
+    """Convert sheet rows into a dictionary of item names and prices, skipping the header row"""
+    return prices_from_rows(values[1:])
+
+def is_retryable(error):
+    """Timeouts, connection failures, throttling and server errors are worth retrying"""
+    if isinstance(error, HttpError):
+        return error.resp.status in RETRYABLE_STATUSES
+    return isinstance(error, (socket.timeout, ConnectionError, httplib2.HttpLib2Error, TransportError))
+
+def _attempt(deadline):
+    """
+    One fetch that gives up at deadline.
+
+    Socket timeouts are capped at the time left, and a watchdog shuts the
+    connection down at the deadline, so a server trickling its response a
+    byte at a time can't keep a read going past it either.
+    """
+    global _deadline
+    with _client_lock:
+        service = get_sheets_service()
+        watchdog = threading.Timer(max(deadline - time.monotonic(), 0), _http.abort)
+        watchdog.daemon = True
+        _deadline = deadline
+        watchdog.start()
+        try:
+            return service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID,
+                                                       range=RANGE_NAME).execute()
+        except Exception as e:
+            if time.monotonic() >= deadline and not isinstance(e, BudgetExceededError):
+                raise BudgetExceededError(f'Google Sheets fetch took longer than {FETCH_BUDGET:g}s') from e
+            raise
+        finally:
+            watchdog.cancel()
+            _deadline = None
+
+def fetch_values():
+    """Fetch the price range, retrying transient failures with jittered backoff, all within FETCH_BUDGET"""
+    deadline = time.monotonic() + FETCH_BUDGET
+    attempt = 0
+    while True:
+        try:
+            return _attempt(deadline)
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            if attempt >= FETCH_RETRIES or not is_retryable(e) or time.monotonic() + delay >= deadline:
+                raise
+            print(f"Retrying Google Sheets fetch in {delay:.2f}s after: {e}")
+            attempt += 1
+            time.sleep(delay)
 
 def get_sheet_data():
     """
     Reads the price data from Google Sheets and returns a dictionary of item names and prices
     """
     try:
-        # Create credentials dict from environment variables
-        credentials_dict = {
-            "type": "service_account",
-            "project_id": os.getenv('GOOGLE_PROJECT_ID'),
-            "private_key_id": os.getenv('GOOGLE_PRIVATE_KEY_ID'),
-            "private_key": os.getenv('GOOGLE_PRIVATE_KEY'),
-            "client_email": os.getenv('GOOGLE_CLIENT_EMAIL'),
-            "client_id": os.getenv('GOOGLE_CLIENT_ID'),
-            "auth_uri": os.getenv('GOOGLE_AUTH_URI'),
-            "token_uri": os.getenv('GOOGLE_TOKEN_URI'),
-            "auth_provider_x509_cert_url": os.getenv('GOOGLE_AUTH_PROVIDER_CERT_URL'),
-            "client_x509_cert_url": os.getenv('GOOGLE_CLIENT_CERT_URL')
-        }
-
-        # Create credentials from the dictionary
-        creds = service_account.Credentials.from_service_account_info(
-            credentials_dict, scopes=SCOPES)
-
-        # Build the service
-        service = build('sheets', 'v4', credentials=creds)
-
-        # Call the Sheets API
-        sheet = service.spreadsheets()
-        result = sheet.values().get(spreadsheetId=SPREADSHEET_ID,
-                                  range=RANGE_NAME).execute()
+        result = breaker.call(fetch_values)
         values = result.get('values', [])
 
         if not values:
             print('No data found.')
             return {}
 
-        # Convert to dictionary, skipping header row
-        prices = {}
-        for row in values[1:]:  # Skip header row
-            if len(row) >= 2:  # Ensure row has both item name and price
-                try:
-                    # Remove any whitespace and convert price to float
-                    item_name = row[0].strip()
-                    price = float(row[1].strip().replace('$', '').replace(',', ''))
-                    prices[item_name] = price
-                except (ValueError, IndexError) as e:
-                    print(f"Error processing row {row}: {e}")
-                    continue
-
-        return prices
+        return parse_price_rows(values)
 
+    except CircuitOpenError as e:
+        print(f"Skipping Google Sheets fetch: {e}")
+        return {}
     except Exception as e:
         print(f"Error accessing Google Sheets: {e}")
-        return {} 
\ No newline at end of file
+        return {}
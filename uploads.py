@@ -0,0 +1,105 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from flask import current_app
+from flask.wrappers import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+# Bytes kept from the start of every upload for MIME sniffing
+HEAD_SIZE = 2048
+
+class UploadFile:
+    """
+    An uploaded file written to disk as the request body is parsed.
+
+    Its size, SHA-256 digest and first HEAD_SIZE bytes are worked out in
+    the same pass, so validation never has to seek or re-read the file and
+    the upload is never held in worker memory. A file larger than max_bytes
+    is abandoned as soon as it crosses the limit. Unless keep_as moves it
+    into place, the file is deleted when it is closed, which Flask does at
+    the end of the request.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b''
+        self._kept = False
+
+    @classmethod
+    def copy_from(cls, source, directory, max_bytes=None, chunk_size=64 * 1024):
+        """Stream another file object into a new upload"""
+        upload = cls(directory, max_bytes)
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            upload.write(chunk)
+        upload.seek(0)
+        return upload
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge()
+        if len(self.head) < HEAD_SIZE:
+            self.head += bytes(data[:HEAD_SIZE - len(self.head)])
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def keep_as(self, path):
+        """Move the finished upload to path instead of deleting it on close"""
+        self._file.close()
+        os.chmod(self.path, 0o644)  # mkstemp files are private; the web server must read these
+        try:
+            os.replace(self.path, path)
+        except OSError:
+            # Another filesystem: copy next to the target, then rename into place
+            temporary = f'{path}.{os.getpid()}.tmp'
+            shutil.copyfile(self.path, temporary)
+            os.replace(temporary, path)
+            os.remove(self.path)
+        self._kept = True
+
+    def close(self):
+        self._file.close()
+        if not self._kept:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        # read, seek, tell, flush and the rest of the file interface
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+def upload_directory(app):
+    """Where uploads are written while they are received; keep it on the same filesystem as the uploads' final home"""
+    return app.config.get('UPLOAD_TEMP_FOLDER') or os.path.join(app.instance_path, 'uploads')
+
+class UploadRequest(Request):
+    """Request whose multipart file fields are parsed straight into UploadFiles"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadFile(upload_directory(current_app), current_app.config.get('MAX_CONTENT_LENGTH'))
+
+def as_upload(file):
+    """The UploadFile behind a FileStorage, streaming it into one if it was parsed another way"""
+    if not isinstance(file.stream, UploadFile):
+        file.stream.seek(0)
+        # Replacing the stream lets the request close, and so delete, the copy
+        file.stream = UploadFile.copy_from(file.stream, upload_directory(current_app))
+    return file.stream
@@ -1,5 +1,6 @@
 import re
 import os
+import threading
 from werkzeug.utils import secure_filename
 from flask import current_app
 import validators
@@ -18,6 +19,19 @@ class ValidationError(Exception):
     """Custom exception for validation errors"""
     pass
 
+# One libmagic handle for the process, created on first use; a handle must not
+# be used by two threads at once
+_sniffer = None
+_sniffer_lock = threading.Lock()
+
+def sniff_mime_type(content):
+    """MIME type of content (the first few KB of a file are enough)"""
+    global _sniffer
+    with _sniffer_lock:
+        if _sniffer is None:
+            _sniffer = magic.Magic(mime=True)
+        return _sniffer.from_buffer(content)
+
 def validate_required(value, field_name):
     """Validate that a field is not empty"""
     if not value or (isinstance(value, str) and value.strip() == ''):
@@ -164,10 +178,12 @@ def validate_file_upload(file, field_name="File", required=False, allowed_extens
         if ext not in allowed_extensions:
             raise ValidationError(f"{field_name} must be one of the following types: {', '.join(allowed_extensions)}")
     
-    # Check file size
-    file.seek(0, os.SEEK_END)
-    file_size = file.tell()
-    file.seek(0)  # Reset file pointer
+    # Check file size; uploads parsed by UploadRequest were measured as they arrived
+    file_size = getattr(file.stream, 'size', None)
+    if file_size is None:
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)  # Reset file pointer
     
     max_size_bytes = max_size_mb * 1024 * 1024
     if file_size > max_size_bytes:
@@ -176,15 +192,18 @@ def validate_file_upload(file, field_name="File", required=False, allowed_extens
     # Check file content type (requires python-magic)
     if MAGIC_AVAILABLE and allowed_extensions and any(ext in ['jpg', 'jpeg', 'png', 'gif'] for ext in allowed_extensions):
         try:
-            file_content = file.read(2048)  # Read first 2048 bytes for mime detection
-            file.seek(0)  # Reset file pointer
+            file_content = getattr(file.stream, 'head', None)
+            if file_content is None:
+                file_content = file.read(2048)  # Read first 2048 bytes for mime detection
+                file.seek(0)  # Reset file pointer
             
-            mime = magic.Magic(mime=True)
-            mime_type = mime.from_buffer(file_content)
+            mime_type = sniff_mime_type(file_content)
             
             # Validate image files
             if not mime_type.startswith('image/'):
                 raise ValidationError(f"{field_name} is not a valid image file")
+        except ValidationError:
+            raise
         except Exception as e:
             # Log the error but continue with basic validation
             try: